@@ -0,0 +1,51 @@
+from frame_sampler import read_frames_at, video_frame_info
+
+def process_video_adaptive(cms, video_path, viewer_age, coarse_seconds=5, precision_seconds=1, batch_size=16):
+    """Analyse a video coarse-to-fine and return process_video-style results ordered by frame
+
+    Frames are first sampled every coarse_seconds. Every gap between two
+    analysed frames whose actions differ or that is not ALLOW on both sides is
+    then bisected, level by level, until it is no wider than precision_seconds.
+    Clean stretches stay sparsely sampled while flagged scenes and their edges
+    end up sampled at the precision the editor needs.
+    """
+    original_fps, frame_count = video_frame_info(video_path)
+    coarse_step = max(1, int(round(coarse_seconds * original_fps)))
+    precision_frames = max(1, int(round(precision_seconds * original_fps)))
+
+    verdicts = {}
+
+    def analyse(frame_numbers):
+        frames = read_frames_at(video_path, [n for n in frame_numbers if n not in verdicts])
+        for start in range(0, len(frames), batch_size):
+            batch = frames[start:start + batch_size]
+            analyses = cms.analyze_frames([frame for _, frame in batch], viewer_age=viewer_age)
+            for result in cms.frame_results(batch, analyses, viewer_age, original_fps):
+                verdicts[result["frame_number"]] = result
+
+    def needs_refinement(start, end):
+        if end - start <= precision_frames or start not in verdicts or end not in verdicts:
+            return False
+        start_action = verdicts[start]["action"]
+        end_action = verdicts[end]["action"]
+        return start_action != end_action or start_action != "ALLOW"
+
+    # Coarse pass, always including the last frame so the tail can be refined
+    coarse_frames = list(range(0, frame_count, coarse_step))
+    if frame_count > 0 and coarse_frames[-1] != frame_count - 1:
+        coarse_frames.append(frame_count - 1)
+    analyse(coarse_frames)
+    coarse_count = len(verdicts)
+
+    analysed = sorted(verdicts)
+    intervals = list(zip(analysed, analysed[1:]))
+    while intervals:
+        intervals = [(start, end) for start, end in intervals if needs_refinement(start, end)]
+        midpoints = [(start + end) // 2 for start, end in intervals]
+        analyse(midpoints)
+        intervals = [pair for (start, end), mid in zip(intervals, midpoints) for pair in ((start, mid), (mid, end))]
+
+    fixed_rate_count = -(-frame_count // precision_frames) if frame_count else 0
+    print(f"Adaptive sampling analysed {len(verdicts)} frames ({coarse_count} coarse) "
+          f"instead of {fixed_rate_count} at a fixed {precision_seconds}s interval")
+    return [verdicts[frame_number] for frame_number in sorted(verdicts)]
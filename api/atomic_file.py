@@ -0,0 +1,23 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+@contextmanager
+def atomic_write_path(path):
+    """Yield a unique temporary path next to path and move it over path once the block succeeds
+
+    Readers never see a partial file, and concurrent writers, including threads
+    of one process, never share a temporary file. The temporary file is removed
+    if the block raises.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -10,6 +10,7 @@ def transcribe_gcs_with_word_time_offsets(audio_uri: str) -> dict:
         dict: The response containing the transcription results with word time offsets.
     """
     from google.cloud import speech
+    from metrics import stage_timer
 
     client = speech.SpeechClient()
 
@@ -21,10 +22,11 @@ def transcribe_gcs_with_word_time_offsets(audio_uri: str) -> dict:
         enable_word_time_offsets=True,
     )
 
-    operation = client.long_running_recognize(config=config, audio=audio)
+    with stage_timer("speech_to_text"):
+        operation = client.long_running_recognize(config=config, audio=audio)
 
-    print("Waiting for operation to complete...")
-    result = operation.result(timeout=90)
+        print("Waiting for operation to complete...")
+        result = operation.result(timeout=90)
 
     transcription_result = {
         "results": []
@@ -0,0 +1,325 @@
+import bisect
+import json
+import math
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from frame_sampler import keyframe_times
+
+# Seconds within which a cut point counts as landing on a keyframe
+KEYFRAME_TOLERANCE = 1e-3
+
+def probe_video(input_path):
+    """Return (duration in seconds, has_audio) for a media file using ffprobe"""
+    output = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-show_entries", "format=duration:stream=codec_type",
+            "-of", "json",
+            input_path
+        ],
+        capture_output=True, text=True, check=True
+    ).stdout
+    info = json.loads(output)
+    has_audio = any(stream.get("codec_type") == "audio" for stream in info.get("streams", []))
+    return float(info["format"]["duration"]), has_audio
+
+# H.264 profiles libx264 can reproduce, so re-encoded pieces share one track with copied GOPs
+X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high"
+}
+SMART_PIX_FMTS = ("yuv420p", "yuvj420p")
+
+def video_stream_info(input_path):
+    """Return codec_name, profile, level and pix_fmt of the first video stream"""
+    output = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,profile,level,pix_fmt",
+            "-of", "json",
+            input_path
+        ],
+        capture_output=True, text=True, check=True
+    ).stdout
+    streams = json.loads(output).get("streams", [])
+    return streams[0] if streams else {}
+
+def smart_encoder_options(stream):
+    """Return libx264 options matching a source stream's SPS, or None if it cannot be matched
+
+    Stream-copied GOPs keep the source's profile, level and pixel format, so
+    re-encoded pieces have to use the same ones or players reject the joined track.
+    """
+    profile = X264_PROFILES.get(stream.get("profile"))
+    if stream.get("codec_name") != "h264" or profile is None or stream.get("pix_fmt") not in SMART_PIX_FMTS:
+        return None
+
+    options = ["-c:v", "libx264", "-profile:v", profile, "-pix_fmt", stream["pix_fmt"]]
+    level = stream.get("level")
+    if isinstance(level, int) and level > 0:
+        options += ["-level", f"{level // 10}.{level % 10}"]
+    return options
+
+def gaussian_sigma(kernel_size):
+    """Return the sigma OpenCV derives for a Gaussian kernel of this size when sigma is 0"""
+    return 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+
+def time_ranges_expression(ranges):
+    """Return an ffmpeg expression that is non-zero while t falls in any [start, end) range"""
+    return "+".join(f"gte(t,{start:.6f})*lt(t,{end:.6f})" for start, end in ranges)
+
+def audio_filtergraph(segments):
+    """Return the filter_complex chain keeping the audio of planned segments back to back as [a]"""
+    keep = time_ranges_expression([(start, end) for start, end, _ in segments])
+    return f"[0:a]aselect='{keep}',asetpts=N/SR/TB[a]"
+
+def build_filtergraph(segments, fps, has_audio=True, blur_kernel=99):
+    """Compile planned (start, end, kind) segments into one filter_complex
+
+    Blurred ranges get a Gaussian blur enabled only while t is inside them, on
+    source timestamps, then select/aselect keep only the planned segments and
+    timestamps are regenerated so the kept pieces play back to back.
+    Returns (filtergraph, output labels).
+    """
+    keep = time_ranges_expression([(start, end) for start, end, _ in segments])
+    blurred = [(start, end) for start, end, kind in segments if kind == "blur"]
+
+    video_filters = []
+    if blurred:
+        video_filters.append(f"gblur=sigma={gaussian_sigma(blur_kernel):.4f}:enable='{time_ranges_expression(blurred)}'")
+    video_filters += [f"select='{keep}'", "setpts=N/FRAME_RATE/TB", f"fps={fps}"]
+
+    graph = [f"[0:v]{','.join(video_filters)}[v]"]
+    labels = ["[v]"]
+    if has_audio:
+        graph.append(audio_filtergraph(segments))
+        labels.append("[a]")
+
+    return ";".join(graph), labels
+
+def render_segments(input_path, output_path, segments, fps, blur_kernel=99, has_audio=None):
+    """Render planned segments of input_path to output_path with a single ffmpeg invocation"""
+    if has_audio is None:
+        _, has_audio = probe_video(input_path)
+
+    filtergraph, labels = build_filtergraph(segments, fps, has_audio, blur_kernel)
+    command = ["ffmpeg", "-v", "error", "-y", "-i", input_path, "-filter_complex", filtergraph]
+    for label in labels:
+        command += ["-map", label]
+    command += ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+    if has_audio:
+        command += ["-c:a", "aac"]
+    command.append(output_path)
+
+    subprocess.run(command, check=True)
+
+def contiguous_runs(segments):
+    """Merge planned segments that touch in source time into (start, end, blurred ranges) runs"""
+    runs = []
+    for start, end, kind in segments:
+        if runs and abs(runs[-1][1] - start) < KEYFRAME_TOLERANCE:
+            runs[-1][1] = end
+        else:
+            runs.append([start, end, []])
+        if kind == "blur":
+            runs[-1][2].append((start, end))
+    return [tuple(run) for run in runs]
+
+def plan_smart_pieces(segments, keyframes, duration):
+    """Split planned segments into ('copy' | 'encode', start, end, blurred ranges) pieces
+
+    Only the GOPs an edit touches are re-encoded: every blurred range widened to
+    the surrounding keyframes, and the partial GOP at a cut that does not land on
+    a keyframe. Everything between is stream-copied from keyframe to keyframe.
+    """
+    keyframes = sorted(keyframes)
+
+    def is_clean(t):
+        if t <= KEYFRAME_TOLERANCE or t >= duration - KEYFRAME_TOLERANCE:
+            return True
+        i = bisect.bisect_left(keyframes, t - KEYFRAME_TOLERANCE)
+        return i < len(keyframes) and keyframes[i] <= t + KEYFRAME_TOLERANCE
+
+    def floor_keyframe(t):
+        i = bisect.bisect_right(keyframes, t + KEYFRAME_TOLERANCE)
+        return keyframes[i - 1] if i else 0.0
+
+    def ceil_keyframe(t):
+        i = bisect.bisect_left(keyframes, t - KEYFRAME_TOLERANCE)
+        return keyframes[i] if i < len(keyframes) else duration
+
+    pieces = []
+    for run_start, run_end, blurred in contiguous_runs(segments):
+        dirty = [(floor_keyframe(start), ceil_keyframe(end)) for start, end in blurred]
+        if not is_clean(run_start):
+            dirty.append((run_start, ceil_keyframe(run_start)))
+        if not is_clean(run_end):
+            dirty.append((floor_keyframe(run_end), run_end))
+
+        # Clip to the run and merge overlapping or touching dirty ranges
+        merged = []
+        for start, end in sorted((max(start, run_start), min(end, run_end)) for start, end in dirty):
+            if merged and start <= merged[-1][1] + KEYFRAME_TOLERANCE:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        cursor = run_start
+        for start, end in merged:
+            if start - cursor > KEYFRAME_TOLERANCE:
+                pieces.append(("copy", cursor, start, []))
+            piece_blur = [(max(s, start), min(e, end)) for s, e in blurred if s < end and e > start]
+            pieces.append(("encode", start, end, piece_blur))
+            cursor = end
+        if run_end - cursor > KEYFRAME_TOLERANCE:
+            pieces.append(("copy", cursor, run_end, []))
+
+    return pieces
+
+def render_piece(input_path, piece_path, mode, start, end, blurred, encoder_options, blur_kernel=99):
+    """Cut the video of one piece of the source into an MPEG-TS file, stream-copied or re-encoded with encoder_options"""
+    command = ["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.6f}", "-i", input_path, "-t", f"{end - start:.6f}"]
+    if mode == "copy":
+        command += ["-c:v", "copy"]
+    else:
+        if blurred:
+            # -ss before -i resets timestamps, so shift the blurred ranges to piece time
+            local = [(s - start, e - start) for s, e in blurred]
+            command += ["-vf", f"gblur=sigma={gaussian_sigma(blur_kernel):.4f}:enable='{time_ranges_expression(local)}'"]
+        command += encoder_options
+    command += ["-an", "-avoid_negative_ts", "make_zero", "-f", "mpegts", piece_path]
+    subprocess.run(command, check=True)
+
+def concat_pieces(piece_paths, output_path, work_dir, audio_path=None):
+    """Join pieces losslessly with the concat demuxer, taking the audio from audio_path if given"""
+    list_path = os.path.join(work_dir, "pieces.txt")
+    with open(list_path, "w") as f:
+        for path in piece_paths:
+            f.write(f"file '{path}'\n")
+    command = ["ffmpeg", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_path:
+        command += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+    subprocess.run(command + ["-c", "copy", output_path], check=True)
+
+def smart_render_segments(input_path, output_path, segments, encoder_options, blur_kernel=99,
+                          duration=None, has_audio=None, keyframes=None):
+    """Render planned segments re-encoding only the GOPs the edits touch
+
+    encoder_options come from smart_encoder_options for the source. The source
+    frame rate is kept, since copied GOPs cannot be resampled. Pieces are
+    video-only; the audio of the plan is copied when nothing is cut, otherwise
+    encoded once, and muxed with the joined video.
+    Returns the list of pieces that were rendered.
+    """
+    if duration is None or has_audio is None:
+        duration, has_audio = probe_video(input_path)
+    if keyframes is None:
+        keyframes = keyframe_times(input_path)
+
+    pieces = plan_smart_pieces(segments, keyframes, duration)
+    with tempfile.TemporaryDirectory() as work_dir:
+        piece_paths = []
+        for i, (mode, start, end, blurred) in enumerate(pieces):
+            piece_path = os.path.join(work_dir, f"piece_{i:05d}.ts")
+            render_piece(input_path, piece_path, mode, start, end, blurred, encoder_options, blur_kernel)
+            piece_paths.append(piece_path)
+        audio_path = None
+        if has_audio:
+            runs = contiguous_runs(segments)
+            uncut = len(runs) == 1 and runs[0][0] <= KEYFRAME_TOLERANCE and runs[0][1] >= duration - KEYFRAME_TOLERANCE
+            # Matroska holds whatever codec the source audio uses when it is copied
+            audio_path = render_audio(input_path, os.path.join(work_dir, "audio.mka"), segments, copy=uncut)
+        concat_pieces(piece_paths, output_path, work_dir, audio_path)
+
+    return pieces
+
+def split_chunks(segments, workers, min_chunk_seconds=2.0):
+    """Group planned segments into about workers consecutive chunks of similar duration
+
+    Chunks break at segment boundaries; segments longer than a chunk are split
+    into equal parts first so a single long scene still spreads over the pool.
+    """
+    total = sum(end - start for start, end, _ in segments)
+    target = max(total / max(1, workers), min_chunk_seconds)
+
+    parts = []
+    for start, end, kind in segments:
+        count = max(1, math.ceil((end - start) / target - KEYFRAME_TOLERANCE))
+        step = (end - start) / count
+        parts += [(start + i * step, end if i == count - 1 else start + (i + 1) * step, kind) for i in range(count)]
+
+    chunks = [[]]
+    length = 0.0
+    for part in parts:
+        if chunks[-1] and length + (part[1] - part[0]) > target + KEYFRAME_TOLERANCE:
+            chunks.append([])
+            length = 0.0
+        chunks[-1].append(part)
+        length += part[1] - part[0]
+    return [chunk for chunk in chunks if chunk]
+
+def render_chunk(input_path, chunk_path, segments, fps, threads, blur_kernel=99):
+    """Encode the video of one chunk of planned segments into an MPEG-TS file"""
+    offset = segments[0][0]
+    local = [(start - offset, end - offset, kind) for start, end, kind in segments]
+    filtergraph, labels = build_filtergraph(local, fps, has_audio=False, blur_kernel=blur_kernel)
+
+    command = ["ffmpeg", "-v", "error", "-y", "-ss", f"{offset:.6f}", "-t", f"{segments[-1][1] - offset:.6f}",
+               "-i", input_path, "-filter_complex", filtergraph]
+    for label in labels:
+        command += ["-map", label]
+    # A fixed thread count keeps x264 output independent of how chunks are scheduled
+    command += ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-threads", str(threads), "-an", "-f", "mpegts", chunk_path]
+    subprocess.run(command, check=True)
+    return chunk_path
+
+def render_audio(input_path, audio_path, segments, copy=False):
+    """Encode the audio of all planned segments in one pass, so piece joins add no AAC priming gaps
+
+    copy stream-copies the source audio instead, for plans that keep all of it.
+    """
+    command = ["ffmpeg", "-v", "error", "-y", "-i", input_path]
+    if copy:
+        command += ["-map", "0:a:0", "-c:a", "copy"]
+    else:
+        command += ["-filter_complex", audio_filtergraph(segments), "-map", "[a]", "-c:a", "aac"]
+    subprocess.run(command + ["-vn", audio_path], check=True)
+    return audio_path
+
+def parallel_render_segments(input_path, output_path, segments, fps, workers=None, blur_kernel=99,
+                             has_audio=None, min_chunk_seconds=2.0):
+    """Render planned segments as chunks encoded in parallel, then join them losslessly
+
+    Only the video is chunked; the audio is encoded once over the whole plan
+    alongside the chunks and muxed with the joined video. Output is
+    deterministic for a given worker count. Each chunk is its own ffmpeg
+    process, so a thread per chunk is enough to keep them running in parallel.
+    Returns the chunks.
+    """
+    if has_audio is None:
+        _, has_audio = probe_video(input_path)
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    chunks = split_chunks(segments, workers, min_chunk_seconds)
+    with tempfile.TemporaryDirectory() as work_dir:
+        chunk_paths = [os.path.join(work_dir, f"chunk_{i:05d}.ts") for i in range(len(chunks))]
+        audio_path = os.path.join(work_dir, "audio.m4a") if has_audio else None
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks)) + (1 if has_audio else 0)) as pool:
+            audio = pool.submit(render_audio, input_path, audio_path, segments) if has_audio else None
+            # map keeps chunk order regardless of which worker finishes first
+            list(pool.map(
+                render_chunk,
+                [input_path] * len(chunks), chunk_paths, chunks,
+                [fps] * len(chunks), [threads] * len(chunks), [blur_kernel] * len(chunks)
+            ))
+            if audio is not None:
+                audio.result()
+        concat_pieces(chunk_paths, output_path, work_dir, audio_path)
+
+    return chunks
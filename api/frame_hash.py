@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+
+def dhash(frame, hash_size=8):
+    """Return a hash_size * hash_size bit difference hash of a BGR frame as an int"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+def frame_content_key(frame, hash_size=16, levels=8):
+    """Return a perceptual (hash, signature) key for caching detector outputs across videos
+
+    The 256-bit dHash moves by only a few bits when a frame is re-encoded or
+    rescaled, so keys are matched with a Hamming tolerance (see
+    FrameVerdictCache). The signature, each channel's mean quantized to levels
+    steps, must match exactly and keeps flat or dark frames of different
+    colour or brightness apart, since their hashes are all close to zero.
+    """
+    means = cv2.mean(frame)[:frame.shape[2] if frame.ndim == 3 else 1]
+    signature = "".join(str(min(levels - 1, int(mean * levels / 256))) for mean in means)
+    return dhash(frame, hash_size), signature
+
+def hamming_distance(hash_a, hash_b):
+    """Return the number of differing bits between two hashes"""
+    return bin(hash_a ^ hash_b).count("1")
+
+class DuplicateFrameGate:
+    """Skip frames that are perceptually identical to the last analysed frame"""
+
+    def __init__(self, max_distance=4):
+        self.max_distance = max_distance
+        self.reference_hash = None
+        self.frames_seen = 0
+        self.frames_skipped = 0
+
+    def is_duplicate(self, frame):
+        """Return True if frame can reuse the last analysed frame's verdict
+
+        Frames that are not duplicates become the new reference, so callers must
+        analyse every frame for which this returns False.
+        """
+        self.frames_seen += 1
+        if self.max_distance is None:
+            return False
+
+        frame_hash = dhash(frame)
+        if self.reference_hash is not None and hamming_distance(frame_hash, self.reference_hash) <= self.max_distance:
+            self.frames_skipped += 1
+            return True
+
+        self.reference_hash = frame_hash
+        return False
+
+    def stats(self):
+        return {
+            "frames_sampled": self.frames_seen,
+            "frames_analysed": self.frames_seen - self.frames_skipped,
+            "frames_skipped": self.frames_skipped
+        }
@@ -0,0 +1,224 @@
+import subprocess
+import cv2
+import numpy as np
+
+# Supported ways of pulling sampled frames out of a video:
+#   read     - decode every frame and keep one per interval (original behaviour)
+#   grab     - grab() every frame but only retrieve()/decode the sampled ones
+#   seek     - jump straight to each sampled frame index
+#   keyframe - only analyse the video's keyframes (timestamps follow the GOP layout)
+#   ffmpeg   - let ffmpeg decode, select and downscale to the analysis size and read
+#              rawvideo from a pipe into preallocated buffers
+SAMPLING_MODES = ("read", "grab", "seek", "keyframe", "ffmpeg")
+
+# Longest side of frames produced by the ffmpeg mode; YOLO runs at 640 and CLIP at 224
+ANALYSIS_SIZE = 640
+
+def sample_interval(original_fps, fps):
+    """Return the number of source frames between two sampled frames"""
+    return max(1, int(original_fps / fps))
+
+def keyframe_times(video_path):
+    """Return the presentation times (seconds) of the keyframes of the first video stream"""
+    output = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-skip_frame", "nokey",
+            "-show_entries", "frame=pts_time",
+            "-of", "csv=p=0",
+            video_path
+        ],
+        capture_output=True, text=True, check=True
+    ).stdout
+
+    times = []
+    for line in output.splitlines():
+        line = line.strip().rstrip(",")
+        if line and line != "N/A":
+            times.append(float(line))
+    return times
+
+def video_frame_info(video_path):
+    """Return (original_fps, frame_count) as reported by the container"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+def analysis_dimensions(width, height, size=ANALYSIS_SIZE):
+    """Return (width, height) scaled so the longest side is at most size, rounded to even numbers"""
+    scale = min(1.0, size / max(width, height))
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+def iter_ffmpeg_frames(video_path, fps=1, start_frame=0, end_frame=None, size=ANALYSIS_SIZE, ring_size=2, skip=None):
+    """Yield (frame_number, frame, original_fps) decoded, selected and scaled by one ffmpeg process
+
+    ffmpeg keeps every frame on the same sampling grid as the other modes and
+    scales it to the analysis size before piping bgr24 rawvideo. Frames are read
+    into a ring of ring_size preallocated arrays, so no memory is allocated per
+    frame: a yielded frame is only valid until ring_size more frames have been
+    yielded, and callers holding frames longer must size the ring accordingly.
+    Frames skip returns True for are yielded as None and their slot is reused
+    straight away, so they never overwrite frames the caller still holds.
+    """
+    cap = cv2.VideoCapture(video_path)
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    source_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    source_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    frame_interval = sample_interval(original_fps, fps)
+    width, height = analysis_dimensions(source_width, source_height, size)
+
+    # Seek to start_frame on the input so shards do not decode the video from the start;
+    # half a frame early so rounding cannot drop start_frame, whose pts the accurate
+    # seek then keeps as the first frame. n counts from there.
+    seek = []
+    if start_frame:
+        seek = ["-ss", f"{(start_frame - 0.5) / original_fps:.6f}"]
+
+    condition = f"not(mod(n+{start_frame},{frame_interval}))"
+    if end_frame is not None:
+        condition += f"*lt(n+{start_frame},{end_frame})"
+
+    process = subprocess.Popen(
+        [
+            "ffmpeg", "-v", "error", "-nostdin",
+            *seek,
+            "-i", video_path,
+            "-an", "-sn",
+            "-vf", f"select='{condition}',scale={width}:{height}:flags=area",
+            "-vsync", "0",
+            "-pix_fmt", "bgr24",
+            "-f", "rawvideo", "pipe:1"
+        ],
+        stdout=subprocess.PIPE
+    )
+
+    ring = np.empty((ring_size, height, width, 3), dtype=np.uint8)
+    frame_bytes = height * width * 3
+    # First multiple of frame_interval at or after start_frame
+    frame_number = -(-start_frame // frame_interval) * frame_interval
+    slot = 0
+
+    try:
+        while True:
+            view = memoryview(ring[slot]).cast("B")
+            filled = 0
+            while filled < frame_bytes:
+                read = process.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            if filled < frame_bytes:
+                break
+
+            if skip is not None and skip(ring[slot]):
+                yield frame_number, None, original_fps
+            else:
+                yield frame_number, ring[slot], original_fps
+                slot = (slot + 1) % ring_size
+            frame_number += frame_interval
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+def iter_sampled_frames(video_path, fps=1, mode="grab", start_frame=0, end_frame=None, ring_size=2, skip=None):
+    """Yield (frame_number, frame, original_fps) for the sampled frames of a video
+
+    The read, grab, seek and ffmpeg modes yield exactly the same frame numbers,
+    so the derived timestamps do not depend on the mode. start_frame and
+    end_frame restrict sampling to the half-open range [start_frame, end_frame)
+    while keeping the sampling grid of the whole video. skip, if given, is
+    called with every sampled frame, and frames it returns True for (such as
+    near-duplicates) are yielded as None. ring_size only applies to the ffmpeg
+    mode and counts the frames not skipped, see iter_ffmpeg_frames.
+    """
+    if mode not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode {mode!r}, expected one of {SAMPLING_MODES}")
+
+    if mode == "ffmpeg":
+        yield from iter_ffmpeg_frames(video_path, fps, start_frame, end_frame, ring_size=ring_size, skip=skip)
+        return
+
+    for frame_number, frame, original_fps in iter_capture_frames(video_path, fps, mode, start_frame, end_frame):
+        yield frame_number, None if skip is not None and skip(frame) else frame, original_fps
+
+def iter_capture_frames(video_path, fps, mode, start_frame=0, end_frame=None):
+    """Yield (frame_number, frame, original_fps) for the OpenCV sampling modes"""
+    cap = cv2.VideoCapture(video_path)
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = sample_interval(original_fps, fps)
+
+    def in_range(frame_number):
+        return end_frame is None or frame_number < end_frame
+
+    try:
+        if start_frame and mode in ("read", "grab"):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        if mode == "read":
+            frame_count = start_frame
+            while in_range(frame_count):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if frame_count % frame_interval == 0:
+                    yield frame_count, frame, original_fps
+                frame_count += 1
+
+        elif mode == "grab":
+            frame_count = start_frame
+            while in_range(frame_count) and cap.grab():
+                if frame_count % frame_interval == 0:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    yield frame_count, frame, original_fps
+                frame_count += 1
+
+        elif mode == "seek":
+            # First multiple of frame_interval at or after start_frame
+            frame_count = -(-start_frame // frame_interval) * frame_interval
+            while in_range(frame_count):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield frame_count, frame, original_fps
+                frame_count += frame_interval
+
+        else:
+            last_frame = -1
+            for time_seconds in keyframe_times(video_path):
+                frame_number = int(round(time_seconds * original_fps))
+                if frame_number <= last_frame or frame_number < start_frame:
+                    continue
+                if not in_range(frame_number):
+                    break
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                last_frame = frame_number
+                yield frame_number, frame, original_fps
+    finally:
+        cap.release()
+
+def read_frames_at(video_path, frame_numbers):
+    """Return [(frame_number, frame)] for the given frame numbers, seeking to each one in order"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    try:
+        for frame_number in sorted(frame_numbers):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            ret, frame = cap.read()
+            if ret:
+                frames.append((frame_number, frame))
+    finally:
+        cap.release()
+    return frames
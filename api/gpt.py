@@ -1,5 +1,6 @@
 from g4f import Client
 import json
+from metrics import stage_timer
 client = Client()
 
 def analyze_text_with_g4f(transcription_result):
@@ -52,13 +53,14 @@ def analyze_text_with_g4f(transcription_result):
             NONE
             """
 
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": full_text + "\n\nWord timings:\n" + str(words)}
-                ]
-            )
+            with stage_timer("g4f"):
+                response = client.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": full_text + "\n\nWord timings:\n" + str(words)}
+                    ]
+                )
             
             try:
                 gpt_response = response.choices[0].message.content.strip()
@@ -0,0 +1,50 @@
+def merge_ranges(ranges, gap=0.0):
+    """Merge (start, end) ranges that overlap or are at most gap seconds apart, sorted by start"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def subtract_ranges(ranges, holes):
+    """Return the parts of sorted disjoint ranges not covered by sorted disjoint holes"""
+    result = []
+    i = 0
+    for start, end in ranges:
+        # Skip holes that end before this range
+        while i < len(holes) and holes[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(holes) and holes[j][0] < end:
+            if holes[j][0] > start:
+                result.append((start, holes[j][0]))
+            start = max(start, holes[j][1])
+            j += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+def plan_intervals(operations, remove_gap=0.0, blur_gap=0.0):
+    """Normalize (start, end, 'blur' | 'remove') operations into disjoint sorted ranges
+
+    Overlapping or nearby ranges of the same kind are merged, closing gaps of
+    up to remove_gap / blur_gap seconds, and remove wins wherever it overlaps
+    blur. Returns (ranges, stats).
+    """
+    operations = list(operations)
+    removes = merge_ranges([(start, end) for start, end, kind in operations if kind == 'remove'], remove_gap)
+    blurs = merge_ranges([(start, end) for start, end, kind in operations if kind == 'blur'], blur_gap)
+    blurred_seconds = sum(end - start for start, end in blurs)
+    blurs = subtract_ranges(blurs, removes)
+
+    ranges = sorted([(start, end, 'remove') for start, end in removes] +
+                    [(start, end, 'blur') for start, end in blurs])
+    stats = {
+        "operations": len(operations),
+        "ranges": len(ranges),
+        "eliminated": len(operations) - len(ranges),
+        "blur_seconds_removed": round(blurred_seconds - sum(end - start for start, end in blurs), 6)
+    }
+    return ranges, stats
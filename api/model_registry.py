@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+import torch
+from makejson import ContentModerationSystem
+
+class ModelRegistry:
+    """Process-wide holder for a warm ContentModerationSystem shared by every request"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super().__new__(cls)
+                cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._lock = threading.Lock()
+            self._system = None
+            self._load_seconds = None
+            self._loaded_at = None
+            self._initialized = True
+
+    def get(self):
+        """Return the shared moderation system, loading the models on first use"""
+        if self._system is None:
+            with self._lock:
+                # Another thread may have finished loading while we waited for the lock
+                if self._system is None:
+                    start = time.perf_counter()
+                    system = ContentModerationSystem()
+                    self._load_seconds = time.perf_counter() - start
+                    self._loaded_at = time.time()
+                    self._system = system
+                    print(f"Loaded moderation models in {self._load_seconds:.2f}s (pid {os.getpid()})")
+        return self._system
+
+    def preload(self):
+        """Load the models eagerly, e.g. before the server starts accepting traffic"""
+        self.get()
+        return self.stats()
+
+    @property
+    def loaded(self):
+        return self._system is not None
+
+    def stats(self):
+        """Return load time and memory usage of this worker process"""
+        stats = {
+            "pid": os.getpid(),
+            "loaded": self.loaded,
+            "load_seconds": self._load_seconds,
+            "loaded_at": self._loaded_at,
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb()
+        }
+        if self.loaded and self._system.frame_cache is not None:
+            stats["frame_cache"] = self._system.frame_cache.stats()
+        if self.loaded and self._system.device == "cuda":
+            stats["cuda_allocated_mb"] = torch.cuda.memory_allocated() / (1024.0 * 1024.0)
+        return stats
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in megabytes, or None if unavailable"""
+    try:
+        # resource is Unix-only
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def current_rss_mb():
+    """Return the resident set size of this process in megabytes, or None if unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def get_moderation_system():
+    """Return the warm, shared ContentModerationSystem for this worker"""
+    return ModelRegistry().get()
@@ -0,0 +1,168 @@
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from google.api_core import exceptions as google_exceptions
+from google.cloud import vision
+
+LIKELIHOOD_NAMES = {
+    0: "UNKNOWN",
+    1: "VERY_UNLIKELY",
+    2: "UNLIKELY",
+    3: "POSSIBLE",
+    4: "LIKELY",
+    5: "VERY_LIKELY"
+}
+
+# Vision rejects synchronous batch annotate calls with more than 16 images
+MAX_IMAGES_PER_REQUEST = 16
+
+# Returned for an image Vision could not annotate, as the single-image call did
+UNKNOWN_LIKELIHOODS = {
+    "violence": "UNKNOWN",
+    "adult": "UNKNOWN",
+    "racy": "UNKNOWN",
+    "medical": "UNKNOWN"
+}
+
+RETRYABLE_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    ConnectionError,
+    TimeoutError
+)
+
+def annotation_to_dict(safe):
+    """Convert a SafeSearchAnnotation into the likelihood-name dict used by the rating code"""
+    return {
+        "violence": LIKELIHOOD_NAMES[int(safe.violence)],
+        "adult": LIKELIHOOD_NAMES[int(safe.adult)],
+        "racy": LIKELIHOOD_NAMES[int(safe.racy)],
+        "medical": LIKELIHOOD_NAMES[int(safe.medical)]
+    }
+
+class LocalSafeSearchClient:
+    """Offline stand-in for vision.ImageAnnotatorClient used to benchmark SafeSearch throughput
+
+    Simulates a round trip of request_latency plus image_latency per image and
+    reports every category as VERY_UNLIKELY.
+    """
+
+    def __init__(self, request_latency=0.15, image_latency=0.01):
+        self.request_latency = request_latency
+        self.image_latency = image_latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, requests):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.request_latency + self.image_latency * len(requests))
+        safe = SimpleNamespace(violence=1, adult=1, racy=1, medical=1)
+        return SimpleNamespace(responses=[
+            SimpleNamespace(safe_search_annotation=safe, error=SimpleNamespace(message=""))
+            for _ in requests
+        ])
+
+def make_vision_client(backend="google", endpoint=None):
+    """Return a Vision client for the configured backend
+
+    endpoint overrides the Google API host, e.g. to target a local emulator.
+    """
+    if backend == "local":
+        return LocalSafeSearchClient()
+    if backend != "google":
+        raise ValueError(f"Unknown SafeSearch backend {backend!r}")
+    if endpoint:
+        return vision.ImageAnnotatorClient(client_options={"api_endpoint": endpoint})
+    return vision.ImageAnnotatorClient()
+
+class SafeSearchBatcher:
+    """Groups SafeSearch lookups into multi-image batch annotate calls run concurrently"""
+
+    def __init__(self, client, batch_size=MAX_IMAGES_PER_REQUEST, max_in_flight=4,
+                 max_retries=3, backoff_seconds=0.5):
+        self.client = client
+        self.batch_size = min(batch_size, MAX_IMAGES_PER_REQUEST)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="safesearch")
+
+    def detect(self, contents):
+        """Return one likelihood dict per encoded image, in input order
+
+        Images are spread over up to max_in_flight concurrent calls, so even a
+        single CLIP batch of 16 frames is annotated in parallel rather than in
+        one request.
+        """
+        chunk_size = max(1, min(self.batch_size, math.ceil(len(contents) / self.max_in_flight)))
+        chunks = [contents[i:i + chunk_size] for i in range(0, len(contents), chunk_size)]
+        if len(chunks) == 1:
+            return self._annotate_with_retry(chunks[0])
+
+        results = []
+        for chunk_results in self._executor.map(self._annotate_with_retry, chunks):
+            results.extend(chunk_results)
+        return results
+
+    def _annotate_with_retry(self, chunk):
+        attempt = 0
+        while True:
+            try:
+                return self._annotate(chunk)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                # Exponential backoff with jitter so concurrent workers do not retry in lockstep
+                delay = self.backoff_seconds * (2 ** attempt) * (0.5 + random.random())
+                print(f"SafeSearch batch of {len(chunk)} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def _annotate(self, chunk):
+        feature = vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION)
+        requests = [
+            vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+            for content in chunk
+        ]
+        response = self.client.batch_annotate_images(requests=requests)
+
+        results = []
+        for image_response in response.responses:
+            # Per-image errors (bad image data, unsupported format) do not go away on retry
+            if image_response.error.message:
+                print(f"SafeSearch could not annotate an image: {image_response.error.message}")
+                results.append(dict(UNKNOWN_LIKELIHOODS))
+            else:
+                results.append(annotation_to_dict(image_response.safe_search_annotation))
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+def benchmark(num_images=256, max_in_flight=4, request_latency=0.15, image_latency=0.01):
+    """Compare per-image sequential calls against batched concurrent calls on the local stand-in"""
+    contents = [b"\xff\xd8\xff" + bytes([i % 256]) for i in range(num_images)]
+
+    sequential = SafeSearchBatcher(LocalSafeSearchClient(request_latency, image_latency), batch_size=1, max_in_flight=1)
+    start = time.perf_counter()
+    for content in contents:
+        sequential.detect([content])
+    sequential_seconds = time.perf_counter() - start
+
+    batched = SafeSearchBatcher(LocalSafeSearchClient(request_latency, image_latency), max_in_flight=max_in_flight)
+    start = time.perf_counter()
+    batched.detect(contents)
+    batched_seconds = time.perf_counter() - start
+
+    print(f"Sequential: {num_images / sequential_seconds:.1f} images/s")
+    print(f"Batched ({batched.batch_size} per call, {max_in_flight} in flight): {num_images / batched_seconds:.1f} images/s")
+
+if __name__ == "__main__":
+    benchmark()
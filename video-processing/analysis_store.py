@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+import re
+from atomic_file import atomic_write_path
+
+# Record keys are truncated SHA-256 hex digests, see VideoAnalysisStore.key
+KEY_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+def validate_key(key):
+    """Raise ValueError unless key is a well-formed record key"""
+    if not isinstance(key, str) or not KEY_PATTERN.fullmatch(key):
+        raise ValueError("analysis key must be 32 lowercase hex characters")
+
+class VideoAnalysisStore:
+    """On-disk store of age-independent per-frame detector outputs for whole videos
+
+    A record is keyed by the video's content hash, the detector version and the
+    sampling settings, so re-rating the same upload for another viewer age or
+    an edited rating policy never runs a model again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, video_path, detector_version, **sampling):
+        """Return the record key for a video file and its analysis settings"""
+        digest = hashlib.sha256()
+        with open(video_path, "rb") as video_file:
+            for block in iter(lambda: video_file.read(1024 * 1024), b""):
+                digest.update(block)
+        digest.update(json.dumps({"detectors": detector_version, "sampling": sampling}, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def path(self, key):
+        validate_key(key)
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """Return the stored record for key, or None"""
+        try:
+            with open(self.path(key)) as record_file:
+                return json.load(record_file)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, record):
+        with atomic_write_path(self.path(key)) as temp_path:
+            with open(temp_path, "w") as record_file:
+                json.dump(record, record_file)
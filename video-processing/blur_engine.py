@@ -0,0 +1,92 @@
+import time
+import cv2
+import numpy as np
+
+# gaussian: the original full-resolution 99x99 cv2.GaussianBlur
+# downscale: shrink, blur with a proportionally smaller kernel, scale back up
+# box: stack blur, a box-filter approximation of the Gaussian in O(1) per pixel
+# pixelate: area-average into blocks and scale back up with nearest neighbour
+BLUR_MODES = ("gaussian", "downscale", "box", "pixelate")
+
+def odd(value):
+    """Round up to the nearest odd integer of at least 1"""
+    value = max(1, int(round(value)))
+    return value if value % 2 else value + 1
+
+class BlurEngine:
+    """Blurs video frames with a configurable method, reusing its output buffers between frames
+
+    The returned array is overwritten by the next call for a frame of the same
+    shape, so callers that keep frames around must copy them.
+    """
+
+    def __init__(self, mode="gaussian", kernel_size=99, downscale=8, pixel_size=32):
+        if mode not in BLUR_MODES:
+            raise ValueError(f"Unknown blur mode {mode!r}, expected one of {BLUR_MODES}")
+        self.mode = mode
+        self.kernel_size = kernel_size
+        self.downscale = downscale
+        self.pixel_size = pixel_size
+        self.buffers = {}
+
+    def get_buffers(self, frame):
+        """Return the (small, out) buffers for frames of this shape, allocating them once"""
+        key = frame.shape
+        if key not in self.buffers:
+            height, width = frame.shape[:2]
+            factor = self.pixel_size if self.mode == "pixelate" else self.downscale
+            small_shape = (max(1, height // factor), max(1, width // factor)) + frame.shape[2:]
+            self.buffers[key] = (np.empty(small_shape, np.uint8), np.empty(frame.shape, np.uint8))
+        return self.buffers[key]
+
+    def blur(self, frame):
+        """Return a blurred copy of frame in a reused uint8 buffer"""
+        if frame.dtype != np.uint8:
+            frame = frame.astype(np.uint8)
+        small, out = self.get_buffers(frame)
+        size = (frame.shape[1], frame.shape[0])
+        small_size = (small.shape[1], small.shape[0])
+
+        if self.mode == "gaussian":
+            cv2.GaussianBlur(frame, (self.kernel_size, self.kernel_size), 0, dst=out)
+        elif self.mode == "downscale":
+            cv2.resize(frame, small_size, dst=small, interpolation=cv2.INTER_AREA)
+            kernel = odd(self.kernel_size / self.downscale)
+            cv2.GaussianBlur(small, (kernel, kernel), 0, dst=small)
+            cv2.resize(small, size, dst=out, interpolation=cv2.INTER_LINEAR)
+        elif self.mode == "box":
+            cv2.stackBlur(frame, (self.kernel_size, self.kernel_size), dst=out)
+        else:
+            cv2.resize(frame, small_size, dst=small, interpolation=cv2.INTER_AREA)
+            cv2.resize(small, size, dst=out, interpolation=cv2.INTER_NEAREST)
+        return out
+
+    __call__ = blur
+
+def detail_retained(original, blurred):
+    """Return the fraction of the original's Laplacian energy left after blurring, lower is stronger"""
+    def energy(image):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        return cv2.Laplacian(gray, cv2.CV_64F).var()
+    return energy(blurred) / max(energy(original), 1e-9)
+
+def benchmark(width=1920, height=1080, num_frames=30):
+    """Compare the blur modes by frames per second and visual strength on a synthetic frame"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    cv2.putText(frame, "CensorAI", (width // 8, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 10, (255, 255, 255), 20)
+
+    reference = BlurEngine("gaussian").blur(frame).copy()
+    for mode in BLUR_MODES:
+        engine = BlurEngine(mode)
+        engine.blur(frame)
+        start = time.perf_counter()
+        for _ in range(num_frames):
+            blurred = engine.blur(frame)
+        fps = num_frames / (time.perf_counter() - start)
+        difference = np.abs(blurred.astype(np.int16) - reference).mean()
+        print(f"{mode:>9}: {fps:7.1f} fps, detail retained {detail_retained(frame, blurred):.2e}, "
+              f"mean abs diff vs gaussian {difference:.2f}")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import time
+import numpy as np
+import open_clip
+import torch
+from PIL import Image
+from clip_backends import CLIP_BACKENDS, make_image_encoder
+from frame_sampler import iter_sampled_frames
+from makejson import MODEL_PATHS, CLIP_PRETRAINED, TEXT_DESCRIPTIONS, clip_onnx_path, load_frame
+import cv2
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+def load_samples(paths, fps):
+    """Return RGB PIL images from image files, image directories and videos (sampled at fps)"""
+    samples = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append(os.path.join(path, name))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            samples.append(path)
+        else:
+            samples.extend(frame for _, frame, _ in iter_sampled_frames(path, fps))
+
+    return [Image.fromarray(cv2.cvtColor(load_frame(sample), cv2.COLOR_BGR2RGB)) for sample in samples]
+
+def encode(encoder, images, text_features, batch_size):
+    """Return (top-1 category indices, frames per second) for one encoder"""
+    predictions = []
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        features = encoder(images[i:i + batch_size]).float()
+        features /= features.norm(dim=-1, keepdim=True)
+        predictions.append((features @ text_features.T).argmax(dim=-1).numpy())
+    elapsed = time.perf_counter() - start
+    return np.concatenate(predictions), len(images) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a CLIP backend's top-1 categories with the fp32 model")
+    parser.add_argument("samples", nargs="+", help="Images, image directories or videos")
+    parser.add_argument("--backend", default="int8", choices=[b for b in CLIP_BACKENDS if b != "fp32"])
+    parser.add_argument("--fps", type=float, default=1, help="Sampling rate for video samples")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--onnx-path", default=clip_onnx_path())
+    args = parser.parse_args()
+
+    clip_model, preprocess, _ = open_clip.create_model_and_transforms(MODEL_PATHS["CLIP_MODEL"], pretrained=CLIP_PRETRAINED)
+    clip_model = clip_model.eval()
+
+    with torch.no_grad():
+        text_features = clip_model.encode_text(open_clip.tokenize(TEXT_DESCRIPTIONS))
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+
+    images = torch.stack([preprocess(image) for image in load_samples(args.samples, args.fps)])
+    print(f"Loaded {len(images)} samples, {torch.get_num_threads()} threads")
+
+    reference, reference_fps = encode(make_image_encoder(clip_model, "fp32"), images, text_features, args.batch_size)
+    candidate, candidate_fps = encode(
+        make_image_encoder(clip_model, args.backend, onnx_path=args.onnx_path), images, text_features, args.batch_size
+    )
+
+    agreement = float((reference == candidate).mean()) if len(images) else 0.0
+    print(f"fp32: {reference_fps:.1f} frames/s")
+    print(f"{args.backend}: {candidate_fps:.1f} frames/s ({candidate_fps / reference_fps:.2f}x)")
+    print(f"Top-1 category agreement: {agreement:.2%}")
+
+    for i in np.flatnonzero(reference != candidate)[:20]:
+        print(f"  sample {i}: {TEXT_DESCRIPTIONS[reference[i]]} -> {TEXT_DESCRIPTIONS[candidate[i]]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import copy
+import os
+import torch
+from atomic_file import atomic_write_path
+
+# CLIP image encoder backends selectable through MODEL_PATHS["CLIP_BACKEND"]:
+#   fp32 - the open_clip model as loaded
+#   int8 - dynamic int8 quantization of the vision tower's Linear layers (CPU only)
+#   onnx - the vision tower exported to ONNX and run by onnxruntime on CPU
+CLIP_BACKENDS = ("fp32", "int8", "onnx")
+
+class TorchImageEncoder:
+    """Encodes preprocessed image batches with a torch vision tower"""
+
+    def __init__(self, visual):
+        self.visual = visual
+
+    def __call__(self, images):
+        with torch.no_grad():
+            return self.visual(images)
+
+class OnnxImageEncoder:
+    """Encodes preprocessed image batches with an onnxruntime session"""
+
+    def __init__(self, onnx_path, threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The onnx CLIP backend requires the onnxruntime package") from e
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, images):
+        features = self.session.run(None, {self.input_name: images.cpu().numpy()})[0]
+        return torch.from_numpy(features)
+
+def quantize_visual_int8(clip_model):
+    """Return a dynamically int8-quantized copy of the CLIP vision tower"""
+    visual = copy.deepcopy(clip_model.visual).cpu().eval()
+    return torch.ao.quantization.quantize_dynamic(visual, {torch.nn.Linear}, dtype=torch.qint8)
+
+def export_visual_onnx(clip_model, onnx_path, image_size=224):
+    """Export the CLIP vision tower to ONNX with a dynamic batch dimension"""
+    visual = copy.deepcopy(clip_model.visual).cpu().eval()
+    with atomic_write_path(onnx_path) as temp_path:
+        torch.onnx.export(
+            visual,
+            torch.randn(1, 3, image_size, image_size),
+            temp_path,
+            input_names=["images"],
+            output_names=["features"],
+            dynamic_axes={"images": {0: "batch"}, "features": {0: "batch"}},
+            opset_version=17
+        )
+
+def make_image_encoder(clip_model, backend="fp32", device="cpu", onnx_path=None):
+    """Return a callable mapping a preprocessed (N, 3, H, W) batch to image features"""
+    if backend not in CLIP_BACKENDS:
+        raise ValueError(f"Unknown CLIP backend {backend!r}, expected one of {CLIP_BACKENDS}")
+
+    if backend != "fp32" and device != "cpu":
+        print(f"CLIP backend {backend} is CPU only, using fp32 on {device}")
+        backend = "fp32"
+
+    if backend == "int8":
+        return TorchImageEncoder(quantize_visual_int8(clip_model))
+
+    if backend == "onnx":
+        if not os.path.exists(onnx_path):
+            print(f"Exporting CLIP vision tower to {onnx_path}")
+            export_visual_onnx(clip_model, onnx_path)
+        return OnnxImageEncoder(onnx_path, threads=torch.get_num_threads())
+
+    return TorchImageEncoder(clip_model.visual)
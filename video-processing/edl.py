@@ -0,0 +1,109 @@
+import json
+import numpy as np
+
+# Bump when the layout of either form changes
+EDL_VERSION = 1
+
+# Operation codes of the structured-array form, indexed by the "op" field
+EDL_OPERATIONS = ("blur", "remove")
+
+EDL_DTYPE = np.dtype([
+    ("start", np.float64),
+    ("end", np.float64),
+    ("start_frame", np.int64),
+    ("end_frame", np.int64),
+    ("op", np.uint8)
+])
+
+class EditDecisionList:
+    """Numeric list of timed edit operations passed from the moderator to the editor
+
+    operations is a structured array of EDL_DTYPE with times in seconds and
+    frame indices at source_fps; interval is the sampling interval in seconds,
+    i.e. how long each sampled verdict applies. The JSON form stores the same
+    columns as parallel arrays so it loads without per-operation parsing.
+    """
+
+    def __init__(self, operations, source_fps, interval):
+        self.operations = np.asarray(operations, dtype=EDL_DTYPE)
+        self.source_fps = float(source_fps)
+        self.interval = float(interval)
+
+    def __len__(self):
+        return len(self.operations)
+
+    @classmethod
+    def from_frames(cls, frame_numbers, actions, source_fps, interval):
+        """Build an EDL from sampled frame numbers and their actions, dropping 'allow'"""
+        frame_numbers = np.asarray(frame_numbers, dtype=np.int64)
+        actions = np.asarray([action.lower() for action in actions])
+        codes = np.full(len(actions), -1, dtype=np.int64)
+        for code, operation in enumerate(EDL_OPERATIONS):
+            codes[actions == operation] = code
+        keep = codes >= 0
+
+        operations = np.empty(int(keep.sum()), dtype=EDL_DTYPE)
+        operations["start"] = frame_numbers[keep] / source_fps
+        operations["end"] = operations["start"] + interval
+        operations["start_frame"] = frame_numbers[keep]
+        operations["end_frame"] = np.round(operations["end"] * source_fps).astype(np.int64)
+        operations["op"] = codes[keep]
+        return cls(operations, source_fps, interval)
+
+    @classmethod
+    def from_results(cls, results, source_fps, interval):
+        """Build an EDL from process_video-style results"""
+        return cls.from_frames(
+            [result["frame_number"] for result in results],
+            [result["action"] for result in results],
+            source_fps, interval
+        )
+
+    def ranges(self):
+        """Return the operations as (start, end, operation name) tuples"""
+        names = np.asarray(EDL_OPERATIONS)[self.operations["op"]]
+        return list(zip(self.operations["start"].tolist(), self.operations["end"].tolist(), names.tolist()))
+
+    def to_json(self):
+        """Return the JSON form as a dict"""
+        return {
+            "version": EDL_VERSION,
+            "source_fps": self.source_fps,
+            "interval": self.interval,
+            "operations": list(EDL_OPERATIONS),
+            "columns": {name: self.operations[name].tolist() for name in EDL_DTYPE.names}
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Build an EDL from its JSON form"""
+        if data.get("version") != EDL_VERSION:
+            raise ValueError(f"Unsupported EDL version {data.get('version')!r}, expected {EDL_VERSION}")
+        if list(data["operations"]) != list(EDL_OPERATIONS):
+            raise ValueError(f"Unexpected EDL operation codes {data['operations']!r}")
+
+        columns = data["columns"]
+        operations = np.empty(len(columns["start"]), dtype=EDL_DTYPE)
+        for name in EDL_DTYPE.names:
+            operations[name] = columns[name]
+        return cls(operations, data["source_fps"], data["interval"])
+
+    def save(self, path):
+        """Write the EDL as JSON (.json) or as a NumPy archive holding the structured array (.npz)"""
+        if path.endswith(".npz"):
+            np.savez(path, version=EDL_VERSION, source_fps=self.source_fps,
+                     interval=self.interval, operations=self.operations)
+        else:
+            with open(path, "w") as edl_file:
+                json.dump(self.to_json(), edl_file)
+
+    @classmethod
+    def load(cls, path):
+        """Read an EDL written by save"""
+        if path.endswith(".npz"):
+            with np.load(path) as archive:
+                if int(archive["version"]) != EDL_VERSION:
+                    raise ValueError(f"Unsupported EDL version {int(archive['version'])}, expected {EDL_VERSION}")
+                return cls(archive["operations"], float(archive["source_fps"]), float(archive["interval"]))
+        with open(path) as edl_file:
+            return cls.from_json(json.load(edl_file))
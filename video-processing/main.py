@@ -1,14 +1,93 @@
-from flask import Flask, request, send_file
+from flask import Flask, Response, request, send_file, jsonify, stream_with_context
 import os
 import tempfile
 import uuid  # Import the uuid module
 from werkzeug.utils import secure_filename # Import secure_filename
-from makejson import ContentModerationSystem
+from model_registry import ModelRegistry, get_moderation_system
 import json
 from video_processor import VideoEditor
+from metrics import render_prometheus, track_request
+from rating_engine import validate_ratings
+from analysis_store import validate_key
 
 app = Flask(__name__)
 
+# Load the moderation models before the first request when PRELOAD_MODELS=1
+if os.environ.get("PRELOAD_MODELS") == "1":
+    ModelRegistry().preload()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/models', methods=['GET'])
+def model_stats():
+    return jsonify(ModelRegistry().stats())
+
+@app.route('/rerate', methods=['POST'])
+def rerate():
+    """Re-rate a stored video analysis for another age or rating policy without running the models"""
+    data = request.get_json(silent=True) or {}
+    if 'analysis_id' not in data or 'age' not in data:
+        return "Missing analysis_id or age", 400
+
+    try:
+        validate_key(data['analysis_id'])
+    except ValueError:
+        return "Invalid analysis_id", 400
+
+    try:
+        age = int(data['age'])
+    except (TypeError, ValueError):
+        return "age must be an integer", 400
+    ratings = data.get('content_ratings')
+    if ratings is not None:
+        try:
+            validate_ratings(ratings)
+        except ValueError as e:
+            return str(e), 400
+
+    cms = get_moderation_system()
+    analysis = cms.load_video_analysis(data['analysis_id'])
+    if analysis is None:
+        return "Unknown analysis_id", 404
+
+    if data.get('format') == 'edl':
+        return jsonify(cms.video_edl(analysis, age, ratings).to_json())
+
+    results = cms.rate_video_analysis(analysis, age, ratings)
+    return jsonify([
+        {key: value for key, value in result.items() if key != 'analysis'}
+        for result in results
+    ])
+
+@app.route('/moderate_stream', methods=['POST'])
+def moderate_stream():
+    """Stream per-frame moderation results as NDJSON, or as Server-Sent Events when requested"""
+    if 'video' not in request.files or 'age' not in request.form:
+        return "Missing video or age", 400
+
+    age = request.form['age']
+    video_path, error = save_uploaded_video(request.files['video'])
+    if error:
+        return error
+
+    use_sse = request.form.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+
+    def generate():
+        try:
+            cms = get_moderation_system()
+            for result in cms.iter_video_results(video_path, age):
+                line = json.dumps({key: value for key, value in result.items() if key != 'analysis'})
+                yield f"data: {line}\n\n" if use_sse else line + "\n"
+            if use_sse:
+                yield "event: done\ndata: {}\n\n"
+        finally:
+            os.remove(video_path)
+
+    mimetype = 'text/event-stream' if use_sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={'X-Accel-Buffering': 'no'})
+
 @app.route('/process_video', methods=['POST'])
 def process_video():
     if 'video' not in request.files or 'age' not in request.form:
@@ -17,10 +96,28 @@ def process_video():
     video = request.files['video']
     age = request.form['age']
 
+    video_path, error = save_uploaded_video(video)
+    if error:
+        return error
+
+    # Process the video based on the age
+    with track_request() as timings:
+        processed_video_path = process_video_based_on_age(video_path, age)
+
+    breakdown = timings.summary()
+    print(f"Stage timings for {video_path}: {json.dumps(breakdown)}")
+
+    # Return the processed video
+    response = send_file(processed_video_path, as_attachment=True, mimetype='video/mp4')
+    response.headers['X-Stage-Timings'] = json.dumps(breakdown)
+    return response
+
+def save_uploaded_video(video):
+    """Save an uploaded video under a unique temporary name and return (path, error response)"""
     # Sanitize the filename
     filename = secure_filename(video.filename)
     if not filename:
-        return "Invalid filename", 400
+        return None, ("Invalid filename", 400)
 
     # Save the video to a temporary file with a unique name
     temp_dir = tempfile.gettempdir()
@@ -30,28 +127,22 @@ def process_video():
     try:
         video.save(video_path)
     except Exception as e:
-        return f"Error saving video: {str(e)}", 500
+        return None, (f"Error saving video: {str(e)}", 500)
 
-    # Process the video based on the age
-    processed_video_path = process_video_based_on_age(video_path, age)
-
-    # Return the processed video
-    return send_file(processed_video_path, as_attachment=True, mimetype='video/mp4')
+    return video_path, None
 
 def process_video_based_on_age(video_path, age):
-    cms = ContentModerationSystem()
-    video_results = cms.process_content(video_path, age, 'video')
-    json_results = []
-    for frame_result in video_results:
-        if frame_result['action'].lower() != 'allow':
-            json_results.append({
-                "timestamp": frame_result['timestamp'],
-                "operation": frame_result['action'].lower()
-            })
-    print(json_results)
-    editor = VideoEditor()
-    operations_data = json_results
-    operations = editor.load_operations(operations_data)
+    cms = get_moderation_system()
+    # Detector outputs do not depend on the age, so repeat requests for the same video only re-rate
+    analysis = cms.analyze_video(video_path)
+    edl = cms.video_edl(analysis, age)
+    print(f"Edit decision list: {len(edl)} operations at {edl.interval:.3f}s intervals")
+    editor = VideoEditor(
+        renderer=os.environ.get("VIDEO_RENDERER", "moviepy"),
+        blur_mode=os.environ.get("BLUR_MODE", "gaussian"),
+        encode_workers=int(os.environ.get("ENCODE_WORKERS", 0)) or None
+    )
+    operations = editor.load_edl(edl)
     editor.process_video_with_audio(video_path, 'output.mp4', operations)
 
     # Return the path to the processed video
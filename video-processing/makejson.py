@@ -3,10 +3,25 @@ import open_clip
 import cv2
 import numpy as np
 from PIL import Image
-from google.cloud import vision
 from ultralytics import YOLO
 from datetime import datetime, timedelta
+from frame_sampler import ANALYSIS_SIZE, iter_sampled_frames, sample_interval, video_frame_info
+from frame_hash import DuplicateFrameGate, frame_content_key
+from verdict_cache import FrameVerdictCache
+from safesearch import UNKNOWN_LIKELIHOODS, SafeSearchBatcher, make_vision_client
+from pipeline import iter_pipelined_results
+from sharding import iter_sharded_results
+from adaptive_sampling import process_video_adaptive
+from analysis_store import VideoAnalysisStore
+from atomic_file import atomic_write_path
+from edl import EditDecisionList
+from rating_engine import analyses_to_arrays, compile_policy, frame_reasons, rate_frames
+from clip_backends import make_image_encoder
+from metrics import count, stage_timer, timed, timed_iter
+import hashlib
+import json
 import os
+import threading
 
 # System Configuration
 SYSTEM_INFO = {
@@ -18,7 +33,128 @@ SYSTEM_INFO = {
 # Model Paths
 MODEL_PATHS = {
     "YOLO_MODEL": "aloo.pt",
-    "CLIP_MODEL": "ViT-B/32"
+    "CLIP_MODEL": "ViT-B/32",
+    # Image encoder backend: "fp32", "int8" or "onnx" (see clip_backends.CLIP_BACKENDS)
+    "CLIP_BACKEND": "fp32",
+    # Exported ONNX vision towers, keyed by model and pretrained tag (see clip_onnx_path)
+    "CLIP_ONNX_DIR": "cache/clip_onnx"
+}
+
+# Precomputed CLIP text embeddings, keyed by model and description list
+CLIP_PRETRAINED = "openai"
+CLIP_TEXT_CACHE_DIR = "cache/clip_text"
+
+def clip_onnx_path():
+    """Return the ONNX export for the current CLIP model and pretrained weights"""
+    key = hashlib.sha256(json.dumps({
+        "model": MODEL_PATHS["CLIP_MODEL"],
+        "pretrained": CLIP_PRETRAINED
+    }).encode("utf-8")).hexdigest()[:16]
+    model_name = MODEL_PATHS["CLIP_MODEL"].replace("/", "-")
+    return os.path.join(MODEL_PATHS["CLIP_ONNX_DIR"], f"{model_name}_{key}.onnx")
+
+# Number of sampled frames encoded together by classify_frames_with_clip
+CLIP_BATCH_SIZE = 16
+
+# YOLO frames per model call and inference input size
+YOLO_BATCH_SIZE = 16
+YOLO_IMAGE_SIZE = 640
+
+# How process_video pulls sampled frames from the video (see frame_sampler.SAMPLING_MODES);
+# "ffmpeg" decodes straight to frame_sampler.ANALYSIS_SIZE through a rawvideo pipe
+FRAME_SAMPLING_MODE = "grab"
+
+# Frames whose difference hash is within this many bits of the last analysed frame
+# reuse its verdict instead of running the detectors; None disables the gate
+DEDUP_MAX_DISTANCE = 4
+
+# SafeSearch client: "google" for the Vision API or "local" for the offline stand-in
+SAFESEARCH = {
+    "BACKEND": "google",
+    "ENDPOINT": None,
+    "BATCH_SIZE": 16,
+    "MAX_IN_FLIGHT": 4,
+    "MAX_RETRIES": 3,
+    "BACKOFF_SECONDS": 0.5
+}
+
+# Cascaded detector execution: CLIP always runs, YOLO and then SafeSearch only
+# run for frames whose CLIP verdict is uncertain or sensitive for the viewer age.
+# Applies to process_video only; analyze_video (/process_video) always runs every stage
+CASCADE = {
+    "ENABLED": False,
+    # Escalate when the best CLIP score beats the runner-up by less than this
+    "MIN_CLIP_MARGIN": 0.02,
+    # Viewers at or above this age cannot be affected by YOLO or SafeSearch findings
+    "MAX_ESCALATION_AGE": 18,
+    # CLIP categories whose verdict YOLO or SafeSearch may still tighten
+    "ESCALATE_CATEGORIES": [
+        "explicit sexual content",
+        "nudity",
+        "violence and gore",
+        "self harm or suicide",
+        "weapons with violence",
+        "weapons without violence",
+        "mild romantic content",
+        "horror elements",
+        "minimal clothing",
+        "suggestive dialogue",
+        "mature themes"
+    ]
+}
+
+# Staged decode -> inference -> SafeSearch I/O -> rating pipeline for process_video
+PIPELINE = {
+    "ENABLED": False,
+    # Batches buffered between two stages before the upstream stage blocks
+    "QUEUE_SIZE": 4,
+    # Batches whose SafeSearch calls may be in flight at the same time
+    "IO_WORKERS": 2
+}
+
+# Split long videos into time ranges analysed in a process pool;
+# WORKERS None uses one worker per CPU
+SHARDING = {
+    "ENABLED": False,
+    "SHARD_SECONDS": 60,
+    "WORKERS": None
+}
+
+# Coarse-to-fine sampling: analyse every COARSE_SECONDS, then bisect around
+# verdict changes and non-ALLOW frames down to PRECISION_SECONDS.
+# Applies to process_video only; analyze_video (/process_video) always samples at a fixed rate
+ADAPTIVE_SAMPLING = {
+    "ENABLED": False,
+    "COARSE_SECONDS": 5,
+    "PRECISION_SECONDS": 1
+}
+
+# Per-video store of age-independent detector outputs used by analyze_video
+ANALYSIS_STORE = {
+    "PATH": "cache/analyses",
+    # Bump when the stored record format changes
+    "SCHEMA_VERSION": 3
+}
+
+# Cross-video cache of raw detector outputs keyed by frame content (a 256-bit dHash
+# plus a quantized colour signature, see frame_hash.frame_content_key); set ENABLED
+# to False to always run the detectors, PATH to None for memory only
+FRAME_CACHE = {
+    "ENABLED": True,
+    "PATH": "cache/frame_verdicts.sqlite3",
+    "MEMORY_ENTRIES": 10000,
+    # Largest dHash Hamming distance still treated as the same frame (below 8)
+    "MAX_DISTANCE": 6,
+    # Bump when the stored analysis format changes
+    "SCHEMA_VERSION": 3
+}
+
+# Likelihoods assumed for a detector stage that the cascade skipped
+SKIPPED_SAFE_SEARCH = {
+    "violence": "UNKNOWN",
+    "adult": "UNKNOWN",
+    "racy": "UNKNOWN",
+    "medical": "UNKNOWN"
 }
 
 # Content Categories
@@ -111,100 +247,219 @@ CONTENT_RATINGS = {
     }
 }
 
+def detector_version():
+    """Return a short hash identifying the models and categories behind cached analyses"""
+    return hashlib.sha256(json.dumps({
+        "models": MODEL_PATHS,
+        "pretrained": CLIP_PRETRAINED,
+        "descriptions": TEXT_DESCRIPTIONS,
+        "yolo_image_size": YOLO_IMAGE_SIZE,
+        "analysis_size": ANALYSIS_SIZE,
+        # The local SafeSearch stand-in must never share cached results with the Vision API
+        "safe_search": [SAFESEARCH["BACKEND"], SAFESEARCH["ENDPOINT"]],
+        "schema": FRAME_CACHE["SCHEMA_VERSION"]
+    }, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def load_frame(image):
+    """Return a BGR numpy frame for an image path, encoded bytes, PIL image or numpy frame"""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, Image.Image):
+        return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+    if isinstance(image, (bytes, bytearray)):
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(image)
+
+def frame_to_bytes(image):
+    """Return encoded image bytes, JPEG-encoding in memory only when given a decoded frame"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, str):
+        with open(image, "rb") as image_file:
+            return image_file.read()
+    ok, buffer = cv2.imencode(".jpg", load_frame(image))
+    if not ok:
+        raise ValueError("Could not encode frame as JPEG")
+    return buffer.tobytes()
+
+def cascade_stats(stage_counts):
+    """Summarise how often each cascade stage ran or was skipped for a video"""
+    frames = stage_counts.get("clip", 0)
+    stats = {"frames": frames}
+    for stage in ["yolo", "safe_search"]:
+        ran = stage_counts.get(stage, 0)
+        stats[f"{stage}_skipped"] = frames - ran
+        stats[f"{stage}_skip_rate"] = (frames - ran) / frames if frames else 0.0
+    return stats
+
 class ContentModerationSystem:
     def __init__(self):
         # Initialize models
         self.clip_model, self.preprocess, self.tokenizer = open_clip.create_model_and_transforms(
             MODEL_PATHS["CLIP_MODEL"],
-            pretrained="openai"
+            pretrained=CLIP_PRETRAINED
         )
         self.yolo_model = YOLO(MODEL_PATHS["YOLO_MODEL"])
-        self.vision_client = vision.ImageAnnotatorClient()
+        self.vision_client = make_vision_client(SAFESEARCH["BACKEND"], SAFESEARCH["ENDPOINT"])
+        self.safesearch = SafeSearchBatcher(
+            self.vision_client,
+            batch_size=SAFESEARCH["BATCH_SIZE"],
+            max_in_flight=SAFESEARCH["MAX_IN_FLIGHT"],
+            max_retries=SAFESEARCH["MAX_RETRIES"],
+            backoff_seconds=SAFESEARCH["BACKOFF_SECONDS"]
+        )
+
+        # The Ultralytics predictor keeps per-call state, so requests sharing this
+        # instance through the model registry take turns running YOLO
+        self.yolo_lock = threading.Lock()
 
         # Set device
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.clip_model = self.clip_model.to(self.device)
+        self.clip_model = self.clip_model.to(self.device).eval()
+        self.text_features = self.load_text_features()
+        self.encode_image = make_image_encoder(
+            self.clip_model, MODEL_PATHS["CLIP_BACKEND"], self.device, onnx_path=clip_onnx_path()
+        )
 
         # Set system time and user
         self.current_time = datetime.strptime(SYSTEM_INFO["CURRENT_UTC"], "%Y-%m-%d %H:%M:%S")
         self.current_user = SYSTEM_INFO["CURRENT_USER"]
 
-    def classify_with_clip(self, image_path):
+        self.analysis_store = VideoAnalysisStore(ANALYSIS_STORE["PATH"])
+        self.default_policy = None
+
+        self.frame_cache = None
+        if FRAME_CACHE["ENABLED"]:
+            self.frame_cache = FrameVerdictCache(
+                detector_version(),
+                db_path=FRAME_CACHE["PATH"],
+                max_memory_entries=FRAME_CACHE["MEMORY_ENTRIES"],
+                max_distance=FRAME_CACHE["MAX_DISTANCE"]
+            )
+
+    def text_features_cache_path(self):
+        """Return the cache file for the current CLIP model and text descriptions"""
+        key = hashlib.sha256(json.dumps({
+            "model": MODEL_PATHS["CLIP_MODEL"],
+            "pretrained": CLIP_PRETRAINED,
+            "descriptions": TEXT_DESCRIPTIONS
+        }).encode("utf-8")).hexdigest()[:16]
+        model_name = MODEL_PATHS["CLIP_MODEL"].replace("/", "-")
+        return os.path.join(CLIP_TEXT_CACHE_DIR, f"{model_name}_{key}.pt")
+
+    def load_text_features(self):
+        """Load normalized CLIP text features from disk, encoding them on a cache miss"""
+        cache_path = self.text_features_cache_path()
+
+        if os.path.exists(cache_path):
+            try:
+                cached = torch.load(cache_path, map_location=self.device)
+                if cached["descriptions"] == TEXT_DESCRIPTIONS:
+                    return cached["features"].to(self.device)
+            except Exception as e:
+                print(f"Ignoring unreadable text feature cache {cache_path}: {e}")
+
+        text_tokens = open_clip.tokenize(TEXT_DESCRIPTIONS).to(self.device)
+        with torch.no_grad():
+            text_features = self.clip_model.encode_text(text_tokens)
+            text_features /= text_features.norm(dim=-1, keepdim=True)
+
+        with atomic_write_path(cache_path) as temp_path:
+            torch.save({
+                "model": MODEL_PATHS["CLIP_MODEL"],
+                "descriptions": list(TEXT_DESCRIPTIONS),
+                "features": text_features.cpu()
+            }, temp_path)
+
+        return text_features
+
+    def classify_with_clip(self, image):
         """Classify image content using CLIP model"""
-        image = self.preprocess(Image.open(image_path)).unsqueeze(0)
-        text_tokens = open_clip.tokenize(TEXT_DESCRIPTIONS)
+        similarity = self.classify_frames_with_clip([load_frame(image)])[0]
+        return TEXT_DESCRIPTIONS[int(similarity.argmax())]
 
-        image = image.to(self.device)
-        text_tokens = text_tokens.to(self.device)
+    @timed("clip")
+    def classify_frames_with_clip(self, frames, batch_size=CLIP_BATCH_SIZE):
+        """Return an (N, len(TEXT_DESCRIPTIONS)) similarity matrix for N decoded frames
 
-        with torch.no_grad():
-            image_features = self.clip_model.encode_image(image)
-            text_features = self.clip_model.encode_text(text_tokens)
+        Frames may be PIL images or BGR numpy arrays as returned by OpenCV.
+        """
+        similarities = []
 
-            image_features /= image_features.norm(dim=-1, keepdim=True)
-            text_features /= text_features.norm(dim=-1, keepdim=True)
+        for start in range(0, len(frames), batch_size):
+            batch = []
+            for frame in frames[start:start + batch_size]:
+                if isinstance(frame, np.ndarray):
+                    frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                batch.append(self.preprocess(frame))
+            images = torch.stack(batch).to(self.device)
 
-            similarity = (image_features @ text_features.T).squeeze(0)
+            with torch.no_grad():
+                image_features = self.encode_image(images).float().to(self.device)
+                image_features /= image_features.norm(dim=-1, keepdim=True)
 
-        best_match_idx = similarity.argmax().item()
-        return TEXT_DESCRIPTIONS[best_match_idx]
+                similarities.append((image_features @ self.text_features.T).cpu().numpy())
 
-    def check_google_safesearch(self, image_path):
-        """Check image content using Google Vision SafeSearch"""
-        with open(image_path, "rb") as image_file:
-            content = image_file.read()
-            image = vision.Image(content=content)
-
-        response = self.vision_client.safe_search_detection(image=image)
-        safe = response.safe_search_annotation
-
-        likelihood_dict = {
-            0: "UNKNOWN",
-            1: "VERY_UNLIKELY",
-            2: "UNLIKELY",
-            3: "POSSIBLE",
-            4: "LIKELY",
-            5: "VERY_LIKELY"
-        }
+        if not similarities:
+            return np.empty((0, len(TEXT_DESCRIPTIONS)), dtype=np.float32)
+        return np.concatenate(similarities)
 
-        return {
-            "violence": likelihood_dict[safe.violence],
-            "adult": likelihood_dict[safe.adult],
-            "racy": likelihood_dict[safe.racy],
-            "medical": likelihood_dict[safe.medical]
-        }
+    def check_google_safesearch(self, image):
+        """Check image content using Google Vision SafeSearch"""
+        return self.safesearch.detect([frame_to_bytes(image)])[0]
 
-    def detect_with_yolo(self, image_path):
+    def detect_with_yolo(self, image):
         """Detect objects using YOLO model"""
-        results = self.yolo_model(image_path)
-        detected_objects = []
+        return self.yolo_detections_to_objects(self.detect_frames_with_yolo([load_frame(image)])[0])
+
+    @timed("yolo")
+    def detect_frames_with_yolo(self, frames, batch_size=YOLO_BATCH_SIZE, imgsz=YOLO_IMAGE_SIZE):
+        """Run YOLO over BGR frames in batches and return one detection array per frame
 
-        for result in results:
-            for box in result.boxes:
-                obj_name = result.names[int(box.cls)]
-                detected_objects.append((obj_name, box.conf.item()))
+        Each array has shape (num_detections, 6) and float32 columns
+        class id, confidence, x1, y1, x2, y2 (pixels in the source frame).
+        """
+        detections = []
 
-        return detected_objects
+        for start in range(0, len(frames), batch_size):
+            with self.yolo_lock:
+                results = self.yolo_model(frames[start:start + batch_size], imgsz=imgsz, verbose=False)
 
-    def determine_rating(self, clip_category, safe_search_results, yolo_detections):
-        """Determine content rating based on multiple detection results"""
+            for result in results:
+                # boxes.data rows are x1, y1, x2, y2, confidence, class id
+                data = result.boxes.data.cpu().numpy()
+                detections.append(np.ascontiguousarray(data[:, [5, 4, 0, 1, 2, 3]], dtype=np.float32))
+
+        return detections
+
+    def yolo_detections_to_objects(self, detections):
+        """Convert a detection array into the (object name, confidence) pairs used for rating"""
+        names = self.yolo_model.names
+        return [(names[int(class_id)], float(confidence)) for class_id, confidence in detections[:, :2]]
+
+    def determine_rating(self, clip_category, safe_search_results, yolo_detections, ratings=None):
+        """Determine content rating based on multiple detection results
+
+        ratings overrides the CONTENT_RATINGS policy, e.g. to re-rate stored analyses.
+        """
+        ratings = ratings or CONTENT_RATINGS
         rating = "U"
         reasons = []
 
         # Check CLIP category against ratings
-        for rating_key, rating_info in CONTENT_RATINGS.items():
+        for rating_key, rating_info in ratings.items():
             if clip_category in rating_info["allowed_content"]:
-                if rating_info["min_age"] > CONTENT_RATINGS[rating]["min_age"]:
+                if rating_info["min_age"] > ratings[rating]["min_age"]:
                     rating = rating_key
                     reasons.append(f"Contains {clip_category}")
                 break
 
         # Check SafeSearch results
         if safe_search_results["adult"] in ["VERY_LIKELY", "LIKELY"]:
-            rating = max(rating, "A", key=lambda x: CONTENT_RATINGS[x]["min_age"])
+            rating = max(rating, "A", key=lambda x: ratings[x]["min_age"])
             reasons.append("Adult content detected")
         elif safe_search_results["violence"] in ["VERY_LIKELY", "LIKELY"]:
-            rating = max(rating, "U/A 16+", key=lambda x: CONTENT_RATINGS[x]["min_age"])
+            rating = max(rating, "U/A 16+", key=lambda x: ratings[x]["min_age"])
             reasons.append("Violence detected")
 
         # Check YOLO detections
@@ -215,7 +470,7 @@ class ContentModerationSystem:
                     reasons.append(f"Detected {obj}")
                 elif obj == "weapons":
                     if safe_search_results["violence"] in ["POSSIBLE", "LIKELY", "VERY_LIKELY"]:
-                        rating = max(rating, "U/A 16+", key=lambda x: CONTENT_RATINGS[x]["min_age"])
+                        rating = max(rating, "U/A 16+", key=lambda x: ratings[x]["min_age"])
                         reasons.append("Weapons with violence context detected")
 
         return rating, reasons
@@ -227,18 +482,120 @@ class ContentModerationSystem:
         else:
             return self.process_video(path, viewer_age)
 
-    def process_image(self, image_path, viewer_age):
-        """Process single image"""
-        # Get content analysis results
-        clip_category = self.classify_with_clip(image_path)
-        safe_search_results = self.check_google_safesearch(image_path)
-        yolo_detections = self.detect_with_yolo(image_path)
+    def analyze_frames(self, frames, contents=None, viewer_age=None, cascade=False, stage_counts=None):
+        """Return the raw, age-independent detector outputs for a list of BGR frames
+
+        Each analysis holds the full CLIP similarity vector, the SafeSearch
+        likelihoods and the YOLO (object, confidence) detections. Frames found in
+        the frame cache skip every model; the misses share one CLIP batch.
+        contents optionally carries already-encoded bytes for SafeSearch.
+
+        With cascade=True, YOLO and SafeSearch only run for frames that
+        needs_escalation selects for viewer_age; skipped stages are stored as None
+        and such partial analyses are not cached. stage_counts, if given, is
+        updated with how many frames ran or skipped each stage.
+        """
+        partial = self.run_local_detectors(frames, viewer_age, cascade, stage_counts)
+        return self.run_remote_detectors(frames, partial, contents, stage_counts)
+
+    def run_local_detectors(self, frames, viewer_age=None, cascade=False, stage_counts=None):
+        """Run the frame cache lookup, CLIP and YOLO stages of analyze_frames
+
+        Returns (analyses, frame_keys, misses, safe_search_frames) for run_remote_detectors.
+        """
+        analyses = [None] * len(frames)
+        frame_keys = [None] * len(frames)
+
+        if self.frame_cache is not None:
+            for i, frame in enumerate(frames):
+                frame_keys[i] = frame_content_key(frame)
+                analyses[i] = self.frame_cache.get(frame_keys[i])
+
+        misses = [i for i, analysis in enumerate(analyses) if analysis is None]
+        if not misses:
+            return analyses, frame_keys, misses, []
+
+        similarities = self.classify_frames_with_clip([frames[i] for i in misses])
+        for i, similarity in zip(misses, similarities):
+            analyses[i] = {
+                "clip_scores": [float(score) for score in similarity],
+                "safe_search": None,
+                "yolo": None
+            }
+
+        # YOLO is local and cheaper than a SafeSearch round trip, so it runs first
+        yolo_frames = misses
+        if cascade:
+            yolo_frames = [i for i in misses if self.needs_escalation(analyses[i], viewer_age)]
+        yolo_detections = self.detect_frames_with_yolo([frames[i] for i in yolo_frames])
+        for i, detections in zip(yolo_frames, yolo_detections):
+            analyses[i]["yolo"] = self.yolo_detections_to_objects(detections)
+
+        # Frames already removed for this viewer cannot be rated any stricter
+        safe_search_frames = yolo_frames
+        if cascade:
+            safe_search_frames = [i for i in yolo_frames if self.rate_analysis(analyses[i], viewer_age)[1] != "REMOVE"]
+
+        if stage_counts is not None:
+            stage_counts["clip"] = stage_counts.get("clip", 0) + len(misses)
+            stage_counts["yolo"] = stage_counts.get("yolo", 0) + len(yolo_frames)
+
+        return analyses, frame_keys, misses, safe_search_frames
+
+    def run_remote_detectors(self, frames, partial, contents=None, stage_counts=None):
+        """Run the SafeSearch stage of analyze_frames and cache the completed analyses"""
+        analyses, frame_keys, misses, safe_search_frames = partial
+
+        safe_search_results = []
+        if safe_search_frames:
+            with stage_timer("safe_search"):
+                safe_search_results = self.safesearch.detect([
+                    frame_to_bytes(contents[i] if contents and contents[i] is not None else frames[i])
+                    for i in safe_search_frames
+                ])
+        for i, safe_search in zip(safe_search_frames, safe_search_results):
+            analyses[i]["safe_search"] = safe_search
+
+        if stage_counts is not None:
+            stage_counts["safe_search"] = stage_counts.get("safe_search", 0) + len(safe_search_frames)
+
+        if self.frame_cache is not None:
+            for i in misses:
+                # Frames SafeSearch failed to annotate are retried on their next appearance
+                if (analyses[i]["yolo"] is not None and analyses[i]["safe_search"] is not None
+                        and analyses[i]["safe_search"] != UNKNOWN_LIKELIHOODS):
+                    self.frame_cache.put(frame_keys[i], analyses[i])
+
+        return analyses
+
+    def needs_escalation(self, analysis, viewer_age):
+        """Return True if YOLO and SafeSearch could change the CLIP-only verdict for viewer_age"""
+        if int(viewer_age) >= CASCADE["MAX_ESCALATION_AGE"]:
+            return False
+
+        _, action, _ = self.rate_analysis(analysis, viewer_age)
+        if action == "REMOVE":
+            return False
+
+        scores = np.sort(np.asarray(analysis["clip_scores"]))
+        if scores[-1] - scores[-2] < CASCADE["MIN_CLIP_MARGIN"]:
+            return True
+
+        clip_category = TEXT_DESCRIPTIONS[int(np.argmax(analysis["clip_scores"]))]
+        return clip_category in CASCADE["ESCALATE_CATEGORIES"]
+
+    def rate_analysis(self, analysis, viewer_age, ratings=None):
+        """Turn raw detector outputs into (rating, action, reasons) for a viewer age"""
+        ratings = ratings or CONTENT_RATINGS
+        clip_category = TEXT_DESCRIPTIONS[int(np.argmax(analysis["clip_scores"]))]
+        safe_search_results = analysis["safe_search"] if analysis["safe_search"] is not None else SKIPPED_SAFE_SEARCH
+        yolo_detections = analysis["yolo"] if analysis["yolo"] is not None else []
 
         # Determine rating and reasons
-        rating, reasons = self.determine_rating(clip_category, safe_search_results, yolo_detections)
+        rating, reasons = self.determine_rating(clip_category, safe_search_results, yolo_detections, ratings)
 
         # Determine action based on viewer age
-        if int(viewer_age) < CONTENT_RATINGS[rating]["min_age"]:
+        if int(viewer_age) < ratings[rating]["min_age"]:
             if rating in ["A", "S"]:
                 action = "REMOVE"
             else:
@@ -246,6 +603,20 @@ class ContentModerationSystem:
         else:
             action = "ALLOW"
 
+        return rating, action, reasons
+
+    def process_image(self, image, viewer_age):
+        """Process single image given as a path, encoded bytes, PIL image or BGR numpy frame"""
+        image_path = image if isinstance(image, str) else None
+
+        # Decode once for the local models; SafeSearch reuses the original bytes for paths
+        # and only in-memory frames are JPEG-encoded
+        content = frame_to_bytes(image) if isinstance(image, (str, bytes, bytearray)) else None
+        frame = load_frame(content if content is not None else image)
+
+        analysis = self.analyze_frames([frame], [content])[0]
+        rating, action, reasons = self.rate_analysis(analysis, viewer_age)
+
         return {
             "timestamp": self.current_time.strftime("%Y-%m-%d %H:%M:%S UTC"),
             "path": image_path,
@@ -254,38 +625,250 @@ class ContentModerationSystem:
             "reasons": reasons
         }
 
-    def process_video(self, video_path, viewer_age, fps=1):
-        """Process video and return frame-by-frame decisions"""
-        cap = cv2.VideoCapture(video_path)
-        original_fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_interval = int(original_fps / fps)
-
-        results = []
-        frame_count = 0
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if frame_count % frame_interval == 0:
-                # Save frame temporarily
-                temp_frame_path = f"temp_frame_{frame_count}.jpg"
-                cv2.imwrite(temp_frame_path, frame)
-
-                # Process frame
-                result = self.process_image(temp_frame_path, viewer_age)
-                result["frame_number"] = frame_count
-                result["timestamp"] = str(timedelta(seconds=frame_count/original_fps))
+    def process_video(self, video_path, viewer_age, fps=1, batch_size=CLIP_BATCH_SIZE,
+                      sampling=FRAME_SAMPLING_MODE, dedup_distance=DEDUP_MAX_DISTANCE,
+                      cascade=CASCADE["ENABLED"], pipelined=PIPELINE["ENABLED"],
+                      sharded=SHARDING["ENABLED"], start_frame=0, end_frame=None,
+                      adaptive=ADAPTIVE_SAMPLING["ENABLED"], stats=None):
+        """Process video and return frame-by-frame decisions
+
+        start_frame and end_frame restrict analysis to a frame range; sharded
+        splits the video into ranges analysed by a pool of worker processes.
+        adaptive replaces fixed-rate sampling with coarse-to-fine refinement.
+        stats, if given, is filled with this call's frame statistics.
+        """
+        return list(self.iter_video_results(
+            video_path, viewer_age, fps=fps, batch_size=batch_size, sampling=sampling,
+            dedup_distance=dedup_distance, cascade=cascade, pipelined=pipelined,
+            sharded=sharded, start_frame=start_frame, end_frame=end_frame, adaptive=adaptive,
+            stats=stats
+        ))
+
+    def iter_video_results(self, video_path, viewer_age, fps=1, batch_size=CLIP_BATCH_SIZE,
+                           sampling=FRAME_SAMPLING_MODE, dedup_distance=DEDUP_MAX_DISTANCE,
+                           cascade=CASCADE["ENABLED"], pipelined=PIPELINE["ENABLED"],
+                           sharded=SHARDING["ENABLED"], start_frame=0, end_frame=None,
+                           adaptive=ADAPTIVE_SAMPLING["ENABLED"], stats=None):
+        """Yield process_video results in timestamp order as soon as each frame is decided
+
+        Takes the same options as process_video; stats is complete once the
+        iterator is exhausted. Sequential and pipelined runs
+        yield batch by batch and sharded runs shard by shard; adaptive sampling
+        only knows the final frame set at the end, so it yields after its last pass.
+        """
+        if adaptive:
+            yield from process_video_adaptive(
+                self, video_path, viewer_age,
+                coarse_seconds=ADAPTIVE_SAMPLING["COARSE_SECONDS"],
+                precision_seconds=ADAPTIVE_SAMPLING["PRECISION_SECONDS"],
+                batch_size=batch_size
+            )
+            return
+
+        if sharded:
+            yield from iter_sharded_results(
+                video_path, viewer_age, stats if stats is not None else {}, fps=fps,
+                shard_seconds=SHARDING["SHARD_SECONDS"], workers=SHARDING["WORKERS"],
+                batch_size=batch_size, sampling=sampling, dedup_distance=dedup_distance,
+                cascade=cascade, pipelined=pipelined
+            )
+            return
+
+        if pipelined:
+            yield from iter_pipelined_results(
+                self, video_path, viewer_age, fps=fps, batch_size=batch_size, sampling=sampling,
+                dedup_distance=dedup_distance, cascade=cascade,
+                queue_size=PIPELINE["QUEUE_SIZE"], io_workers=PIPELINE["IO_WORKERS"],
+                start_frame=start_frame, end_frame=end_frame, stats=stats
+            )
+            return
+
+        gate = DuplicateFrameGate(dedup_distance)
+        stage_counts = {}
+        pending = []
+        previous = None
+        analysed_count = 0
+        original_fps = None
+
+        # Only the analysed frames of the current batch are held; duplicates are yielded as None
+        # without taking a slot, which bounds the ffmpeg frame ring
+        sampled_frames = timed_iter(
+            iter_sampled_frames(video_path, fps, sampling, start_frame, end_frame,
+                                ring_size=batch_size + 1, skip=gate.is_duplicate), "decode"
+        )
+        for frame_number, frame, original_fps in sampled_frames:
+            if frame is None:
+                pending.append((frame_number, None))
+                continue
+
+            pending.append((frame_number, frame))
+            analysed_count += 1
+            if analysed_count == batch_size:
+                for previous in self.flush_pending_frames(pending, viewer_age, original_fps, previous, cascade, stage_counts):
+                    yield previous
+                pending = []
+                analysed_count = 0
+
+        if pending:
+            yield from self.flush_pending_frames(pending, viewer_age, original_fps, previous, cascade, stage_counts)
+
+        self.record_video_stats(gate, stage_counts, cascade, stats)
+
+    def analyze_video(self, video_path, fps=1, sampling=FRAME_SAMPLING_MODE, dedup_distance=DEDUP_MAX_DISTANCE, **options):
+        """Return the stored age-independent analysis of a video, running the detectors only once
+
+        The record holds the raw detector outputs of every sampled frame and can
+        be rated for any viewer age or policy with rate_video_analysis. Cascade
+        and adaptive sampling depend on the viewer age, so they are disabled here.
+        """
+        key = self.analysis_store.key(
+            video_path, detector_version(), fps=fps, sampling=sampling,
+            dedup_distance=dedup_distance, schema=ANALYSIS_STORE["SCHEMA_VERSION"]
+        )
+        record = self.analysis_store.load(key)
+        if record is not None:
+            print(f"Loaded stored analysis {key} for {video_path}")
+            return record
+
+        if CASCADE["ENABLED"] or ADAPTIVE_SAMPLING["ENABLED"]:
+            print("analyze_video ignores CASCADE and ADAPTIVE_SAMPLING: stored analyses must hold every stage for every viewer age")
+        options.update(cascade=False, adaptive=False)
+        results = self.process_video(video_path, 0, fps=fps, sampling=sampling, dedup_distance=dedup_distance, **options)
+        source_fps = video_frame_info(video_path)[0]
+        record = {
+            "id": key,
+            "fps": fps,
+            "source_fps": source_fps,
+            # Source frames between samples, the stride the sampled verdicts actually cover
+            "frame_interval": sample_interval(source_fps, fps),
+            "descriptions": list(TEXT_DESCRIPTIONS),
+            "frames": [
+                {
+                    "frame_number": result["frame_number"],
+                    "timestamp": result["timestamp"],
+                    "analysis": result["analysis"]
+                }
+                for result in results
+            ]
+        }
+        self.analysis_store.save(key, record)
+        return record
+
+    def load_video_analysis(self, analysis_id):
+        """Return a stored analysis record by id, or None"""
+        return self.analysis_store.load(analysis_id)
+
+    def rating_policy(self, ratings=None):
+        """Return the compiled rating policy, reusing the one for CONTENT_RATINGS"""
+        if not ratings:
+            if self.default_policy is None:
+                self.default_policy = compile_policy(CONTENT_RATINGS, TEXT_DESCRIPTIONS)
+            return self.default_policy
+        return compile_policy(ratings, TEXT_DESCRIPTIONS)
+
+    def rate_video_analysis(self, record, viewer_age, ratings=None):
+        """Rate a stored video analysis for a viewer age without running any model
+
+        All frames are rated at once by the rating engine. ratings overrides the
+        CONTENT_RATINGS policy. Returns process_video-style results.
+        """
+        analyses = [frame["analysis"] for frame in record["frames"]]
+        policy = self.rating_policy(ratings)
+        clip_scores, safe_search, yolo_adult, yolo_weapons = analyses_to_arrays(analyses)
+        rating_names, actions = rate_frames(policy, clip_scores, safe_search, yolo_adult, yolo_weapons, viewer_age)
+        reasons = frame_reasons(policy, analyses, clip_scores, safe_search)
+
+        return [
+            {
+                "timestamp": frame["timestamp"],
+                "path": None,
+                "rating": rating,
+                "action": action,
+                "reasons": reason_list,
+                "frame_number": frame["frame_number"],
+                "analysis": frame["analysis"]
+            }
+            for frame, rating, action, reason_list in zip(record["frames"], rating_names.tolist(), actions.tolist(), reasons)
+        ]
 
-                results.append(result)
+    def video_edl(self, record, viewer_age, ratings=None):
+        """Rate a stored video analysis and return its blur/remove decisions as an EditDecisionList
+
+        Each sampled verdict covers one sampling stride of the source, which is
+        frame_interval source frames rather than exactly 1 / fps seconds.
+        """
+        analyses = [frame["analysis"] for frame in record["frames"]]
+        _, actions = rate_frames(self.rating_policy(ratings), *analyses_to_arrays(analyses), viewer_age)
+        return EditDecisionList.from_frames(
+            [frame["frame_number"] for frame in record["frames"]], actions,
+            record["source_fps"], record["frame_interval"] / record["source_fps"]
+        )
 
-                # Remove temporary frame
-                os.remove(temp_frame_path)
+    def record_video_stats(self, gate, stage_counts, cascade, stats=None):
+        """Log the frame statistics of a finished process_video call and copy them into stats
+
+        Statistics go to the caller's dict rather than the shared system, so
+        concurrent requests never see each other's numbers.
+        """
+        video_stats = gate.stats()
+        if self.frame_cache is not None:
+            video_stats["frame_cache"] = self.frame_cache.stats()
+        if cascade:
+            video_stats["cascade"] = cascade_stats(stage_counts)
+            print(f"Cascade skip rates: {video_stats['cascade']}")
+        print(f"Analysed {video_stats['frames_analysed']} of {video_stats['frames_sampled']} "
+              f"sampled frames ({video_stats['frames_skipped']} near-duplicates skipped)")
+        if stats is not None:
+            stats.update(video_stats)
+
+    def flush_pending_frames(self, pending, viewer_age, original_fps, previous=None, cascade=False, stage_counts=None):
+        """Analyse the pending (frame_number, frame) pairs and return their results
+
+        previous is the last result already produced, used by leading duplicates.
+        """
+        analyses = self.analyze_frames(
+            [frame for _, frame in pending if frame is not None],
+            viewer_age=viewer_age, cascade=cascade, stage_counts=stage_counts
+        )
+        return self.frame_results(pending, analyses, viewer_age, original_fps, previous)
+
+    def frame_results(self, pending, analyses, viewer_age, original_fps, previous=None, ratings=None):
+        """Rate analysed frames and copy verdicts for skipped duplicates
+
+        pending holds (frame_number, frame) pairs where frame is None for frames
+        the duplicate gate skipped; analyses lines up with the remaining frames.
+        A skipped frame reuses the verdict of the most recent analysed frame,
+        which is earlier in pending or, for a leading duplicate, previous.
+        Each result keeps its raw detector outputs under "analysis".
+        """
+        analyses = iter(analyses)
+        results = []
 
-            frame_count += 1
+        for frame_number, frame in pending:
+            if frame is not None:
+                analysis = next(analyses)
+                rating, action, reasons = self.rate_analysis(analysis, viewer_age, ratings)
+                previous = {
+                    "timestamp": str(timedelta(seconds=frame_number/original_fps)),
+                    "path": None,
+                    "rating": rating,
+                    "action": action,
+                    "reasons": reasons,
+                    "frame_number": frame_number,
+                    "analysis": analysis
+                }
+                results.append(previous)
+                count("moderation_frames_total", kind="analysed")
+                continue
+
+            result = dict(previous)
+            result["reasons"] = list(previous["reasons"])
+            result["frame_number"] = frame_number
+            result["timestamp"] = str(timedelta(seconds=frame_number/original_fps))
+            result["duplicate_of"] = previous.get("duplicate_of", previous["frame_number"])
+            results.append(result)
+            count("moderation_frames_total", kind="duplicate")
 
-        cap.release()
         return results
 
 # Example usage
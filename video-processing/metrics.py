@@ -0,0 +1,134 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+# Stage timings of the request being handled, see track_request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+class RequestTimings:
+    """Per-request breakdown of seconds and call counts spent in each stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.calls = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def summary(self):
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "stages": {
+                    stage: {"seconds": round(seconds, 4), "calls": self.calls[stage]}
+                    for stage, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+                }
+            }
+
+def observe(stage, seconds):
+    """Record one stage duration in the latency histogram and the current request breakdown"""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+def count(name, value=1, **labels):
+    """Increment a counter identified by name and labels"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+@contextmanager
+def stage_timer(stage):
+    """Time the enclosed block as one call of stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def timed(stage):
+    """Decorator timing every call of the wrapped function as stage"""
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+def timed_iter(iterable, stage):
+    """Yield from iterable, timing each step (e.g. decoding the next frame) as stage"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            observe(stage, time.perf_counter() - start)
+        yield item
+
+@contextmanager
+def track_request():
+    """Collect a per-stage timing breakdown for everything run in this context"""
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+def run_in_context(target):
+    """Wrap a thread target so it records into the calling request's breakdown"""
+    context = contextvars.copy_context()
+    def wrapper(*args, **kwargs):
+        return context.run(target, *args, **kwargs)
+    return wrapper
+
+def render_prometheus():
+    """Return all histograms and counters in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        if _histograms:
+            lines.append("# HELP moderation_stage_seconds Time spent per pipeline stage call")
+            lines.append("# TYPE moderation_stage_seconds histogram")
+        for stage, histogram in sorted(_histograms.items()):
+            for bound, bucket_count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f'moderation_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {bucket_count}')
+            lines.append(f'moderation_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'moderation_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'moderation_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+        typed = set()
+        for (name, labels), value in sorted(_counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
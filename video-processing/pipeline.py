@@ -0,0 +1,169 @@
+import queue
+import threading
+from frame_sampler import iter_sampled_frames
+from frame_hash import DuplicateFrameGate
+from metrics import run_in_context, timed_iter
+
+# Marks the end of a stage's output
+_DONE = object()
+
+class _Stage:
+    """Bookkeeping shared by the pipeline threads: stop flag, first error and bounded queue helpers"""
+
+    def __init__(self):
+        self.stop = threading.Event()
+        self.error = None
+        self._error_lock = threading.Lock()
+
+    def fail(self, error):
+        with self._error_lock:
+            if self.error is None:
+                self.error = error
+        self.stop.set()
+
+    def put(self, q, item):
+        """Block until there is room in q, giving up once the pipeline is stopping"""
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        """Block until q yields an item, returning _DONE once the pipeline is stopping"""
+        while not self.stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+def iter_pipelined_results(cms, video_path, viewer_age, fps=1, batch_size=16, sampling="grab",
+                           dedup_distance=4, cascade=False, queue_size=4, io_workers=2,
+                           start_frame=0, end_frame=None, stats=None):
+    """Yield process_video results from a staged producer/consumer pipeline
+
+    A decode thread samples frames and applies the duplicate gate, an inference
+    thread runs the local models (frame cache, CLIP, YOLO), io_workers threads
+    run the remote SafeSearch calls, and the calling thread rates frames.
+    Bounded queues between the stages provide backpressure, and the rating
+    stage reorders batches so results are yielded in timestamp order. stats,
+    if given, receives the frame statistics once all results are yielded.
+    """
+    stage = _Stage()
+    gate = DuplicateFrameGate(dedup_distance)
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    fetched = queue.Queue(maxsize=queue_size)
+    inference_counts = {}
+
+    # Analysed frames stay referenced until their SafeSearch call is done (skipped duplicates
+    # take no ring slot): one batch being built, full decoded and inferred queues, one batch
+    # per busy or blocked stage thread
+    ring_size = batch_size * (2 * queue_size + io_workers + 3) + 1
+    io_counts = [{} for _ in range(io_workers)]
+
+    def decode():
+        try:
+            sequence = 0
+            pending = []
+            analysed_count = 0
+            sampled_frames = timed_iter(
+                iter_sampled_frames(video_path, fps, sampling, start_frame, end_frame,
+                                    ring_size=ring_size, skip=gate.is_duplicate), "decode"
+            )
+            for frame_number, frame, original_fps in sampled_frames:
+                if stage.stop.is_set():
+                    return
+                if frame is None:
+                    pending.append((frame_number, None))
+                    continue
+                pending.append((frame_number, frame))
+                analysed_count += 1
+                if analysed_count == batch_size:
+                    stage.put(decoded, (sequence, pending, original_fps))
+                    sequence += 1
+                    pending = []
+                    analysed_count = 0
+            if pending:
+                stage.put(decoded, (sequence, pending, original_fps))
+        except Exception as e:
+            stage.fail(e)
+        finally:
+            stage.put(decoded, _DONE)
+
+    def infer():
+        try:
+            while True:
+                item = stage.get(decoded)
+                if item is _DONE:
+                    return
+                sequence, pending, original_fps = item
+                frames = [frame for _, frame in pending if frame is not None]
+                partial = cms.run_local_detectors(frames, viewer_age, cascade, inference_counts)
+                stage.put(inferred, (sequence, pending, original_fps, frames, partial))
+        except Exception as e:
+            stage.fail(e)
+        finally:
+            for _ in range(io_workers):
+                stage.put(inferred, _DONE)
+
+    def fetch(counts):
+        try:
+            while True:
+                item = stage.get(inferred)
+                if item is _DONE:
+                    return
+                sequence, pending, original_fps, frames, partial = item
+                analyses = cms.run_remote_detectors(frames, partial, stage_counts=counts)
+                stage.put(fetched, (sequence, pending, original_fps, analyses))
+        except Exception as e:
+            stage.fail(e)
+        finally:
+            stage.put(fetched, _DONE)
+
+    # Stage threads record their timings into the calling request's breakdown
+    threads = [threading.Thread(target=run_in_context(decode), name="moderation-decode", daemon=True),
+               threading.Thread(target=run_in_context(infer), name="moderation-infer", daemon=True)]
+    threads += [threading.Thread(target=run_in_context(fetch), args=(io_counts[i],), name=f"moderation-io-{i}", daemon=True)
+                for i in range(io_workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        # Rating stage: release batches strictly in decode order
+        ready = {}
+        next_sequence = 0
+        finished_workers = 0
+        previous = None
+
+        while finished_workers < io_workers:
+            item = stage.get(fetched)
+            if item is _DONE:
+                if stage.stop.is_set():
+                    break
+                finished_workers += 1
+                continue
+
+            sequence, pending, original_fps, analyses = item
+            ready[sequence] = (pending, original_fps, analyses)
+            while next_sequence in ready:
+                pending, original_fps, analyses = ready.pop(next_sequence)
+                for result in cms.frame_results(pending, analyses, viewer_age, original_fps, previous):
+                    previous = result
+                    yield result
+                next_sequence += 1
+
+        if stage.error is not None:
+            raise stage.error
+
+        stage_counts = dict(inference_counts)
+        stage_counts["safe_search"] = sum(counts.get("safe_search", 0) for counts in io_counts)
+        cms.record_video_stats(gate, stage_counts, cascade, stats)
+    finally:
+        # Unblock and wind down the worker threads if the consumer stopped early or a stage failed
+        stage.stop.set()
+        for thread in threads:
+            thread.join()
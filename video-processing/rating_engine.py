@@ -0,0 +1,151 @@
+import numpy as np
+
+# SafeSearch likelihood names in rank order; skipped lookups count as UNKNOWN
+LIKELIHOODS = ["UNKNOWN", "VERY_UNLIKELY", "UNLIKELY", "POSSIBLE", "LIKELY", "VERY_LIKELY"]
+LIKELIHOOD_RANK = {name: rank for rank, name in enumerate(LIKELIHOODS)}
+SAFE_SEARCH_FIELDS = ["violence", "adult", "racy", "medical"]
+
+# YOLO classes that determine_rating treats as adult-only or as weapons
+YOLO_ADULT_OBJECTS = ["violence", "explicit", "self-harm"]
+YOLO_WEAPON_OBJECTS = ["weapons"]
+YOLO_MIN_CONFIDENCE = 0.6
+
+ACTIONS = np.array(["ALLOW", "BLUR", "REMOVE"])
+
+# Ratings determine_rating and CompiledPolicy refer to by name
+REQUIRED_RATINGS = ["U", "U/A 16+", "A"]
+
+def validate_ratings(ratings):
+    """Raise ValueError unless ratings is a CONTENT_RATINGS-style policy the rating code can use"""
+    if not isinstance(ratings, dict):
+        raise ValueError("content_ratings must be an object mapping rating names to their rules")
+    missing = [name for name in REQUIRED_RATINGS if name not in ratings]
+    if missing:
+        raise ValueError(f"content_ratings is missing the ratings {missing}")
+    for name, info in ratings.items():
+        if (not isinstance(info, dict)
+                or not isinstance(info.get("min_age"), (int, float)) or isinstance(info.get("min_age"), bool)
+                or not isinstance(info.get("allowed_content"), list)):
+            raise ValueError(f"Rating {name!r} needs a numeric min_age and an allowed_content list")
+
+class CompiledPolicy:
+    """A CONTENT_RATINGS policy compiled into lookup arrays for rate_frames
+
+    Ratings are referred to by their index in the policy's order.
+    category_rating maps a CLIP category index to the rating it raises the frame
+    to, mirroring determine_rating: the first rating that lists the category,
+    if it is stricter than the base rating, otherwise the base rating.
+    """
+
+    def __init__(self, ratings, descriptions, base_rating="U", adult_rating="A",
+                 violence_rating="U/A 16+", remove_ratings=("A", "S")):
+        self.names = np.array(list(ratings))
+        self.min_age = np.array([info["min_age"] for info in ratings.values()])
+        self.remove = np.array([name in remove_ratings for name in ratings])
+
+        self.descriptions = list(descriptions)
+        index = {name: i for i, name in enumerate(ratings)}
+        self.base = index[base_rating]
+        self.adult = index[adult_rating]
+        self.violence = index[violence_rating]
+
+        self.category_rating = np.full(len(descriptions), self.base)
+        # Categories that raise the rating, which determine_rating reports as "Contains ..."
+        self.category_raises = np.zeros(len(descriptions), dtype=bool)
+        for c, category in enumerate(descriptions):
+            for r, info in enumerate(ratings.values()):
+                if category in info["allowed_content"]:
+                    if self.min_age[r] > self.min_age[self.base]:
+                        self.category_rating[c] = r
+                        self.category_raises[c] = True
+                    break
+
+    def stricter(self, current, candidate):
+        """Element-wise max of two rating index arrays by minimum age, keeping current on ties"""
+        return np.where(self.min_age[candidate] > self.min_age[current], candidate, current)
+
+def compile_policy(ratings, descriptions):
+    return CompiledPolicy(ratings, descriptions)
+
+def rate_frames(policy, clip_scores, safe_search, yolo_adult, yolo_weapons, viewer_age):
+    """Rate a whole video's frames at once and return (ratings, actions) as string arrays
+
+    clip_scores is (N, categories), safe_search is (N, 4) likelihood ranks in
+    SAFE_SEARCH_FIELDS order and yolo_adult / yolo_weapons are (N,) booleans
+    marking confident YOLO hits. Matches determine_rating and rate_analysis.
+    """
+    clip_scores = np.asarray(clip_scores)
+    safe_search = np.asarray(safe_search)
+    n = len(clip_scores)
+
+    rating = policy.category_rating[np.argmax(clip_scores, axis=1)] if n else np.empty(0, dtype=int)
+
+    violence = safe_search[:, 0]
+    adult = safe_search[:, 1]
+    likely = LIKELIHOOD_RANK["LIKELY"]
+    rating = np.where(adult >= likely, policy.stricter(rating, np.full(n, policy.adult)), rating)
+    rating = np.where((adult < likely) & (violence >= likely), policy.stricter(rating, np.full(n, policy.violence)), rating)
+
+    # An adult-only YOLO hit sets the adult rating outright; weapons need violent context
+    weapons = yolo_weapons & ~yolo_adult & (violence >= LIKELIHOOD_RANK["POSSIBLE"])
+    rating = np.where(weapons, policy.stricter(rating, np.full(n, policy.violence)), rating)
+    rating = np.where(yolo_adult, policy.adult, rating)
+
+    restricted = int(viewer_age) < policy.min_age[rating]
+    action = np.where(restricted, np.where(policy.remove[rating], 2, 1), 0)
+    return policy.names[rating], ACTIONS[action]
+
+def analyses_to_arrays(analyses):
+    """Convert per-frame analysis dicts into the arrays taken by rate_frames"""
+    n = len(analyses)
+    clip_scores = np.array([analysis["clip_scores"] for analysis in analyses], dtype=np.float32)
+    safe_search = np.zeros((n, len(SAFE_SEARCH_FIELDS)), dtype=np.int8)
+    yolo_adult = np.zeros(n, dtype=bool)
+    yolo_weapons = np.zeros(n, dtype=bool)
+
+    for i, analysis in enumerate(analyses):
+        if analysis["safe_search"] is not None:
+            safe_search[i] = [LIKELIHOOD_RANK[analysis["safe_search"][field]] for field in SAFE_SEARCH_FIELDS]
+        for obj, conf in analysis["yolo"] or []:
+            if conf > YOLO_MIN_CONFIDENCE:
+                yolo_adult[i] |= obj in YOLO_ADULT_OBJECTS
+                yolo_weapons[i] |= obj in YOLO_WEAPON_OBJECTS
+
+    return clip_scores, safe_search, yolo_adult, yolo_weapons
+
+def frame_reasons(policy, analyses, clip_scores, safe_search):
+    """Return determine_rating's reasons for each frame, for callers that return them
+
+    clip_scores and safe_search are the analyses_to_arrays outputs for analyses.
+    """
+    if not len(analyses):
+        return []
+
+    likely = LIKELIHOOD_RANK["LIKELY"]
+    possible = LIKELIHOOD_RANK["POSSIBLE"]
+    reasons = []
+    for analysis, category, likelihoods in zip(analyses, np.argmax(clip_scores, axis=1).tolist(), safe_search.tolist()):
+        violence, adult = likelihoods[0], likelihoods[1]
+        frame = []
+        if policy.category_raises[category]:
+            frame.append(f"Contains {policy.descriptions[category]}")
+        if adult >= likely:
+            frame.append("Adult content detected")
+        elif violence >= likely:
+            frame.append("Violence detected")
+        for obj, conf in analysis["yolo"] or []:
+            if conf > YOLO_MIN_CONFIDENCE:
+                if obj in YOLO_ADULT_OBJECTS:
+                    frame.append(f"Detected {obj}")
+                elif obj in YOLO_WEAPON_OBJECTS and violence >= possible:
+                    frame.append("Weapons with violence context detected")
+        reasons.append(frame)
+    return reasons
+
+def rate_stored_analyses(records, viewer_age, policy):
+    """Rate many stored video analysis records and return {record id: (ratings, actions)}"""
+    rated = {}
+    for record in records:
+        arrays = analyses_to_arrays([frame["analysis"] for frame in record["frames"]])
+        rated[record["id"]] = rate_frames(policy, *arrays, viewer_age)
+    return rated
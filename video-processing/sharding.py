@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from frame_sampler import sample_interval, video_frame_info
+
+# Moderation system of a pool worker, loaded once by the pool initializer
+_worker_system = None
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+def _init_worker(workers):
+    global _worker_system
+    # Imported here so the parent process does not need the models loaded
+    import torch
+    from model_registry import get_moderation_system
+    # Split the cores between workers instead of every worker starting one torch thread per core
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    _worker_system = get_moderation_system()
+
+def _analyse_shard(video_path, viewer_age, start_frame, end_frame, options):
+    stats = {}
+    results = _worker_system.process_video(
+        video_path, viewer_age, start_frame=start_frame, end_frame=end_frame,
+        sharded=False, stats=stats, **options
+    )
+    return results, stats
+
+def get_shard_pool(workers):
+    """Return the shared process pool, (re)creating it when the worker count changes
+
+    Workers are spawned rather than forked so they do not inherit torch or
+    gRPC threads from the parent, and each loads the models exactly once.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(workers,)
+            )
+            _pool_workers = workers
+        return _pool
+
+def shard_ranges(frame_count, frame_interval, shard_frames):
+    """Split [0, frame_count) into (start, end) frame ranges aligned to the sampling grid
+
+    The last range is open-ended (end None) because container frame counts are
+    only estimates and frames past the reported count must still be analysed.
+    """
+    shard_frames = max(frame_interval, shard_frames // frame_interval * frame_interval)
+    ranges = []
+    start = 0
+    while start + shard_frames < frame_count:
+        ranges.append((start, start + shard_frames))
+        start += shard_frames
+    ranges.append((start, None))
+    return ranges
+
+def iter_sharded_results(video_path, viewer_age, stats, fps=1, shard_seconds=60, workers=None, **options):
+    """Analyse time ranges of a video in a process pool and yield the merged, ordered results
+
+    Results match the sequential process_video output and are yielded shard by
+    shard as soon as each shard and all earlier ones are done. stats is filled
+    with the summed per-shard frame statistics.
+    """
+    workers = workers or os.cpu_count() or 1
+    original_fps, frame_count = video_frame_info(video_path)
+    frame_interval = sample_interval(original_fps, fps)
+    ranges = shard_ranges(frame_count, frame_interval, int(shard_seconds * original_fps))
+
+    pool = get_shard_pool(workers)
+    options = dict(options, fps=fps)
+    futures = [
+        pool.submit(_analyse_shard, video_path, viewer_age, start_frame, end_frame, options)
+        for start_frame, end_frame in ranges
+    ]
+
+    stats.update({"shards": len(ranges), "workers": workers, "frames_sampled": 0, "frames_analysed": 0, "frames_skipped": 0})
+    try:
+        for future in futures:
+            shard_results, shard_stats = future.result()
+            for key in ["frames_sampled", "frames_analysed", "frames_skipped"]:
+                stats[key] += shard_stats.get(key, 0)
+            yield from shard_results
+    finally:
+        # Do not keep analysing shards nobody will read
+        for future in futures:
+            future.cancel()
+
+    print(f"Analysed {len(ranges)} shards of {shard_seconds}s on {workers} workers")
+
+def process_video_sharded(video_path, viewer_age, fps=1, shard_seconds=60, workers=None, **options):
+    """Return (results, stats) for a sharded analysis, see iter_sharded_results"""
+    stats = {}
+    results = list(iter_sharded_results(
+        video_path, viewer_age, stats, fps=fps, shard_seconds=shard_seconds, workers=workers, **options
+    ))
+    return results, stats
@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from frame_hash import hamming_distance
+
+class FrameVerdictCache:
+    """Content-addressed cache of raw detector outputs per frame
+
+    Entries are keyed by a perceptual frame key, a (hash, signature) pair from
+    frame_hash.frame_content_key, plus the detector version, so a frame that
+    reappears in another upload is never re-analysed and changing a model or the
+    category list invalidates old entries. A lookup matches a stored frame with
+    the same signature whose hash is within max_distance bits, so re-encoded or
+    rescaled copies still hit. The hash is split into bands and every entry is
+    indexed under each band: with fewer differing bits than bands, at least one
+    band matches exactly. A bounded in-memory LRU sits in front of an optional
+    SQLite store shared by all workers on a host.
+    """
+
+    def __init__(self, version, db_path=None, max_memory_entries=10000, max_distance=6, hash_bits=256, bands=8):
+        if max_distance >= bands:
+            raise ValueError("max_distance must be smaller than bands for the band index to find every match")
+        self.version = version
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_distance = max_distance
+        self.hash_bits = hash_bits
+        self.bands = bands
+        self._memory = OrderedDict()
+        self._memory_bands = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS frame_entries (key TEXT PRIMARY KEY, hash TEXT NOT NULL, analysis TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS frame_bands (band TEXT NOT NULL, key TEXT NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS frame_bands_band ON frame_bands (band)")
+            self._db.commit()
+
+    def key(self, frame_key):
+        frame_hash, signature = frame_key
+        return f"{self.version}:{signature}:{frame_hash:0{self.hash_bits // 4}x}"
+
+    def band_keys(self, frame_key):
+        """Return the band index keys of a frame key"""
+        frame_hash, signature = frame_key
+        width = self.hash_bits // self.bands
+        mask = (1 << width) - 1
+        return [f"{self.version}:{signature}:{i}:{(frame_hash >> (i * width)) & mask:x}" for i in range(self.bands)]
+
+    def get(self, frame_key):
+        """Return the cached analysis of the closest matching frame, or None"""
+        key = self.key(frame_key)
+        frame_hash = frame_key[0]
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key][1]
+
+            match = self._closest(frame_hash, (
+                (candidate, self._memory[candidate][0])
+                for band in self.band_keys(frame_key)
+                for candidate in self._memory_bands.get(band, ())
+            ))
+            if match is not None:
+                self._memory.move_to_end(match)
+                self.memory_hits += 1
+                return self._memory[match][1]
+
+            if self._db is not None:
+                bands = self.band_keys(frame_key)
+                rows = self._db.execute(
+                    "SELECT DISTINCT e.key, e.hash FROM frame_bands b JOIN frame_entries e ON e.key = b.key "
+                    f"WHERE b.band IN ({','.join('?' * len(bands))})",
+                    bands
+                ).fetchall()
+                match = self._closest(frame_hash, ((row[0], int(row[1], 16)) for row in rows))
+                if match is not None:
+                    row = self._db.execute("SELECT hash, analysis FROM frame_entries WHERE key = ?", (match,)).fetchone()
+                    analysis = json.loads(row[1])
+                    self._remember(match, int(row[0], 16), self._signature_of(match), analysis)
+                    self.disk_hits += 1
+                    return analysis
+
+            self.misses += 1
+            return None
+
+    def put(self, frame_key, analysis):
+        """Store the raw detector outputs for a frame key"""
+        key = self.key(frame_key)
+        frame_hash, signature = frame_key
+        with self._lock:
+            self._remember(key, frame_hash, signature, analysis)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO frame_entries (key, hash, analysis) VALUES (?, ?, ?)",
+                    (key, f"{frame_hash:x}", json.dumps(analysis))
+                )
+                self._db.execute("DELETE FROM frame_bands WHERE key = ?", (key,))
+                self._db.executemany(
+                    "INSERT INTO frame_bands (band, key) VALUES (?, ?)",
+                    [(band, key) for band in self.band_keys(frame_key)]
+                )
+                self._db.commit()
+
+    def _closest(self, frame_hash, candidates):
+        """Return the key of the candidate (key, hash) nearest to frame_hash within max_distance, or None"""
+        best_key, best_distance = None, self.max_distance + 1
+        for key, candidate_hash in candidates:
+            distance = hamming_distance(frame_hash, candidate_hash)
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def _signature_of(self, key):
+        return key.split(":")[1]
+
+    def _remember(self, key, frame_hash, signature, analysis):
+        if key not in self._memory:
+            for band in self.band_keys((frame_hash, signature)):
+                self._memory_bands.setdefault(band, set()).add(key)
+        self._memory[key] = (frame_hash, analysis)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            evicted, (evicted_hash, _) = self._memory.popitem(last=False)
+            for band in self.band_keys((evicted_hash, self._signature_of(evicted))):
+                keys = self._memory_bands.get(band)
+                if keys is not None:
+                    keys.discard(evicted)
+                    if not keys:
+                        del self._memory_bands[band]
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,10 +1,14 @@
-import cv2
-import numpy as np
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import os
 from typing import List, Dict
 from moviepy.editor import VideoFileClip, AudioFileClip, VideoClip, concatenate_videoclips
+from metrics import stage_timer
+from blur_engine import BlurEngine
+from interval_planner import plan_intervals
+from edl import EditDecisionList
+from ffmpeg_renderer import (probe_video, render_segments, smart_render_segments, parallel_render_segments,
+                             smart_encoder_options, video_stream_info)
 
 class VideoOperation:
     def __init__(self, timestamp: str, operation: str, fps: float = 30.0):
@@ -21,12 +25,29 @@ class VideoOperation:
         return f"Operation: {self.operation} at {self.timestamp} (Duration: {self.duration}s)"
 
 class VideoEditor:
-    def __init__(self):
+    # Renderers: "moviepy" cuts and re-encodes subclips in Python, "ffmpeg" compiles
+    # the plan into a single ffmpeg filtergraph, "smart" re-encodes only the GOPs
+    # the edits touch and stream-copies the rest, "parallel" encodes chunks of the
+    # plan in concurrent ffmpeg processes and joins them
+    RENDERERS = ("moviepy", "ffmpeg", "smart", "parallel")
+
+    def __init__(self, renderer: str = "moviepy", blur_mode: str = "gaussian",
+                 remove_gap: float = None, blur_gap: float = None, encode_workers: int = None):
         self.logger = []
         self.user = 'alaotach'
         self.current_time = "2025-02-23 13:06:54"
         self.fps = 25.0
         self.effect_duration = 1
+        if renderer not in self.RENDERERS:
+            raise ValueError(f"Unknown renderer {renderer!r}, expected one of {self.RENDERERS}")
+        self.renderer = renderer
+        self.blur_engine = BlurEngine(blur_mode)
+        # Gaps (seconds) closed when merging neighbouring operations of the same kind
+        self.remove_gap = self.effect_duration * 1.1 if remove_gap is None else remove_gap
+        self.blur_gap = self.effect_duration * 0.5 if blur_gap is None else blur_gap
+        self.last_plan_stats = None
+        # Encoder processes for the parallel renderer, None for one per CPU
+        self.encode_workers = encode_workers
 
     def log_message(self, message: str):
         """Add a log message with timestamp"""
@@ -47,6 +68,20 @@ class VideoEditor:
             self.log_message(f"Error parsing timestamp {timestamp}: {str(e)}")
             raise
 
+    def load_edl(self, edl: EditDecisionList) -> List[VideoOperation]:
+        """Load operations from an edit decision list, keeping its numeric times and sampling interval"""
+        operations = []
+        for start_time, end_time, operation in edl.ranges():
+            op = VideoOperation(None, operation, self.fps)
+            op.start_time = start_time
+            op.end_time = end_time
+            op.duration = end_time - start_time
+            op.start_frame = int(start_time * self.fps)
+            op.end_frame = int(end_time * self.fps)
+            operations.append(op)
+        self.log_message(f"Loaded {len(operations)} operations from EDL (interval {edl.interval:.3f}s)")
+        return operations
+
     def load_operations(self, operations_data: List[Dict]) -> List[VideoOperation]:
         """Load operations from a list of dictionaries"""
         operations = []
@@ -61,70 +96,52 @@ class VideoEditor:
         return operations
 
     def apply_blur(self, frame):
-        """Apply Gaussian blur to a frame"""
-        return cv2.GaussianBlur(frame.astype(np.uint8), (99, 99), 0)
+        """Blur a frame with the configured blur engine"""
+        return self.blur_engine.blur(frame)
 
     def optimize_operations(self, operations: List[VideoOperation]) -> List[VideoOperation]:
-        """Optimize operations by merging consecutive remove operations and preserving blur operations"""
+        """Normalize operations into disjoint sorted ranges, merging overlaps and letting remove win over blur"""
         if not operations:
             return []
 
-        # Sort operations by start time
-        operations.sort(key=lambda x: x.start_time)
-        optimized = []
-        current = None
-
-        for op in operations:
-            if current is None:
-                current = op
-                continue
-
-            # If there's a blur operation, we need to keep it separate
-            if op.operation == 'blur':
-                if current:
-                    optimized.append(current)
-                optimized.append(op)
-                current = None
-            # If current operation is blur, start a new segment
-            elif current.operation == 'blur':
-                optimized.append(current)
-                current = op
-            # If both are remove operations and they're close in time
-            elif (op.operation == 'remove' and current.operation == 'remove' and 
-                  abs(op.start_time - current.end_time) <= self.effect_duration * 1.1):  # Allow small gaps
-                # Extend current remove operation
-                current.end_time = op.end_time
-                current.end_frame = op.end_frame
-            else:
-                optimized.append(current)
-                current = op
+        ranges, stats = plan_intervals(
+            ((op.start_time, op.end_time, op.operation) for op in operations),
+            remove_gap=self.remove_gap,
+            blur_gap=self.blur_gap
+        )
+        self.last_plan_stats = stats
 
-        if current:
-            optimized.append(current)
-
-        self.log_message(f"Optimized {len(operations)} operations into {len(optimized)} operations")
+        optimized = []
+        for start_time, end_time, operation in ranges:
+            op = VideoOperation(str(timedelta(seconds=start_time)), operation, self.fps)
+            op.start_time = start_time
+            op.end_time = end_time
+            op.duration = end_time - start_time
+            op.start_frame = int(start_time * self.fps)
+            op.end_frame = int(end_time * self.fps)
+            optimized.append(op)
+
+        self.log_message(f"Optimized {len(operations)} operations into {len(optimized)} operations "
+                         f"({stats['eliminated']} segments eliminated)")
         return optimized
 
-    def get_video_segments(self, video: VideoFileClip, operations: List[VideoOperation]) -> List[VideoClip]:
-        """Split video into segments based on optimized operations"""
+    def plan_segments(self, operations: List[VideoOperation], duration: float) -> List[tuple]:
+        """Plan the output as (start, end, kind) segments of the source, kind being 'normal' or 'blur'"""
         segments = []
         current_time = 0.0
-        
+
         # Optimize operations
         operations = self.optimize_operations(operations)
-        
+
         for op in operations:
             # Add segment before current operation if there's a gap
             if current_time < op.start_time - self.effect_duration * 0.5:  # Add small threshold
-                segment = video.subclip(current_time, op.start_time)
-                segments.append(segment)
+                segments.append((current_time, op.start_time, 'normal'))
                 self.log_message(f"Added normal segment: {current_time:.3f}s - {op.start_time:.3f}s")
 
             # Handle the operation segment
             if op.operation == 'blur':
-                segment = video.subclip(op.start_time, op.end_time)
-                blurred_segment = segment.fl_image(self.apply_blur)
-                segments.append(blurred_segment)
+                segments.append((op.start_time, op.end_time, 'blur'))
                 self.log_message(f"Added blur segment: {op.start_time:.3f}s - {op.end_time:.3f}s")
                 current_time = op.end_time
             elif op.operation == 'remove':
@@ -132,18 +149,76 @@ class VideoEditor:
                 current_time = op.end_time
 
         # Add final segment if there's remaining video
-        if current_time < video.duration - self.effect_duration * 0.5:  # Add small threshold
-            segment = video.subclip(current_time, video.duration)
+        if current_time < duration - self.effect_duration * 0.5:  # Add small threshold
+            segments.append((current_time, duration, 'normal'))
+            self.log_message(f"Added final segment: {current_time:.3f}s - {duration:.3f}s")
+
+        return segments
+
+    def get_video_segments(self, video: VideoFileClip, operations: List[VideoOperation]) -> List[VideoClip]:
+        """Split video into segments based on optimized operations"""
+        segments = []
+
+        for start, end, kind in self.plan_segments(operations, video.duration):
+            segment = video.subclip(start, end)
+            if kind == 'blur':
+                segment = segment.fl_image(self.apply_blur)
             segments.append(segment)
-            self.log_message(f"Added final segment: {current_time:.3f}s - {video.duration:.3f}s")
 
         return segments
 
+    def render_with_ffmpeg(self, input_path: str, output_path: str, operations: List[VideoOperation]):
+        """Render all operations with one ffmpeg filtergraph instead of moviepy subclips"""
+        duration, has_audio = probe_video(input_path)
+        segments = self.plan_segments(operations, duration)
+        if not segments:
+            self.log_message("No segments to process - all content was removed")
+            return
+
+        if self.renderer == 'smart':
+            # Copied GOPs have to join re-encoded libx264 pieces with the same profile, level and pixel format
+            stream = video_stream_info(input_path)
+            encoder_options = smart_encoder_options(stream)
+            if encoder_options is not None:
+                with stage_timer("smart_render"):
+                    pieces = smart_render_segments(input_path, output_path, segments, encoder_options,
+                                                   duration=duration, has_audio=has_audio)
+                encoded = sum(end - start for mode, start, end, _ in pieces if mode == 'encode')
+                self.log_message(f"Smart render re-encoded {encoded:.3f}s of {duration:.3f}s in {len(pieces)} pieces")
+                return
+            self.log_message(f"Smart render cannot match a {stream.get('codec_name')} {stream.get('profile')} "
+                             f"{stream.get('pix_fmt')} source - re-encoding everything")
+
+        if self.renderer == 'parallel':
+            with stage_timer("parallel_render"):
+                chunks = parallel_render_segments(input_path, output_path, segments, self.fps,
+                                                  workers=self.encode_workers, has_audio=has_audio)
+            self.log_message(f"Parallel render encoded {len(segments)} segments in {len(chunks)} chunks")
+            return
+
+        self.log_message(f"Rendering {len(segments)} segments with ffmpeg...")
+        with stage_timer("ffmpeg_render"):
+            render_segments(input_path, output_path, segments, self.fps, has_audio=has_audio)
+
     def process_video_with_audio(self, input_path: str, output_path: str, operations: List[VideoOperation]):
         """Process video with multiple operations while preserving audio"""
         self.log_message(f"Starting video processing with audio: {input_path}")
 
         try:
+            # Convert timestamps to seconds and validate; EDL operations already carry their times
+            for op in operations:
+                if op.start_time is not None:
+                    continue
+                op.start_time = self.timestamp_to_seconds(op.timestamp)
+                op.end_time = op.start_time + op.duration
+                op.start_frame = int(op.start_time * self.fps)
+                op.end_frame = int(op.end_time * self.fps)
+
+            if self.renderer != 'moviepy':
+                self.render_with_ffmpeg(input_path, output_path, operations)
+                self.log_message(f"Video processing completed: {output_path}")
+                return True
+
             # Load video with audio
             video = VideoFileClip(input_path)
             
@@ -152,15 +227,9 @@ class VideoEditor:
                 self.log_message(f"Adjusting video FPS from {video.fps} to {self.fps}")
                 video = video.set_fps(self.fps)
 
-            # Convert timestamps to seconds and validate
-            for op in operations:
-                op.start_time = self.timestamp_to_seconds(op.timestamp)
-                op.end_time = op.start_time + op.duration
-                op.start_frame = int(op.start_time * self.fps)
-                op.end_frame = int(op.end_time * self.fps)
-
             # Get optimized video segments
-            segments = self.get_video_segments(video, operations)
+            with stage_timer("moviepy_edit"):
+                segments = self.get_video_segments(video, operations)
 
             # Concatenate segments if any exist
             if segments:
@@ -168,14 +237,15 @@ class VideoEditor:
 
                 # Write output video with audio
                 self.log_message("Writing final video with audio...")
-                final_video.write_videofile(
-                    output_path,
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True,
-                    fps=self.fps
-                )
+                with stage_timer("video_encode"):
+                    final_video.write_videofile(
+                        output_path,
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile='temp-audio.m4a',
+                        remove_temp=True,
+                        fps=self.fps
+                    )
 
                 final_video.close()
             else:
@@ -250,4 +320,4 @@ def main():
             print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
-    main()
+    main()
\ No newline at end of file